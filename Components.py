@@ -14,82 +14,133 @@
 # along with Foobar. If not, see <https://www.gnu.org/licenses/>.
 
 import typing
-
-from openpyxl.utils import get_column_letter
+import time
+from pathlib import Path
 
 from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtWidgets import QWidget, QLineEdit, QAbstractItemView, QTabBar
 from PyQt5.QtCore import QModelIndex, Qt, QAbstractTableModel, QVariant
 
 
+class EmptySheet:
+    # shown until a template is loaded, so the window does not need openpyxl to start
+    title = ''
+    max_row = 0
+    max_column = 0
+
+
 class SheetModel(QAbstractTableModel):
+    brush_conn_excel = None
+    brush_default_value = None
+    brush_both = None
+    
     def __init__(self, sheet=[[]], parent=None):
         super(SheetModel, self).__init__(parent)
         self.sheet = sheet
-        self.indeces_conn_excel = []
-        self.indeces_default_value = []
+        # openpyxl scans every cell for max_row and max_column, index() asks for them on every call
+        self.row_count = sheet.max_row if hasattr(sheet, 'max_row') else 0
+        self.column_count = sheet.max_column if hasattr(sheet, 'max_column') else 0
+        # (row, column) pairs of the model, not QModelIndex, so lookups in data() are O(1)
+        self.indeces_conn_excel = set()
+        self.indeces_default_value = set()
+        self.display_cache = {}
+        self.batch = False
+        
+        if SheetModel.brush_conn_excel is None:
+            gradient = QtGui.QLinearGradient(0, 0, 60, 50)
+            gradient.setColorAt(0, Qt.green)
+            gradient.setColorAt(1, QtGui.QColor( 0xFF, 0xA0, 0x00 ))
+            SheetModel.brush_both = QtGui.QBrush(gradient)
+            SheetModel.brush_conn_excel = QtGui.QBrush(Qt.green)
+            SheetModel.brush_default_value = QtGui.QBrush(QtGui.QColor( 0xFF, 0xA0, 0x00 ))
 
     def headerData(self, section: int, orientation: Qt.Orientation, role: int):
         if role == QtCore.Qt.DisplayRole:
             if orientation == Qt.Horizontal:
+                from openpyxl.utils import get_column_letter
                 return get_column_letter(section + 1)
             else:
                 return str(section + 1)
 
     def columnCount(self, parent=None):
-        return self.sheet.max_column
+        return self.column_count
 
     def rowCount(self, parent=None):
-        return self.sheet.max_row
+        return self.row_count
 
     def setData(self, index: QModelIndex, value: QVariant, role: int):
         if role == Qt.DisplayRole:
             row = index.row() + 1
             col = index.column() + 1
-            self.sheet[get_column_letter(col)+str(row)] = value.value()
+            self.sheet.cell(row=row, column=col).value = value.value()
+            self.display_cache.pop((index.row(), index.column()), None)
+            self.cellChanged(index, Qt.DisplayRole)
+            return True
         
         return super(SheetModel, self).setData(index, value, role)
     
     def setSheet(self, sheet):
+        self.beginResetModel()
         self.sheet = sheet
+        self.row_count = sheet.max_row
+        self.column_count = sheet.max_column
+        self.display_cache = {}
+        self.endResetModel()
+        
+    def beginBatchReset(self):
+        # for bulk updates: one reset instead of a signal per cell
+        self.batch = True
+        self.beginResetModel()
+        
+    def endBatchReset(self):
+        self.batch = False
+        self.endResetModel()
+        
+    def cellChanged(self, index, role):
+        if not self.batch:
+            self.dataChanged.emit(index, index, [role])
     
     def addIndecesConnExcel(self, index):
-        if index not in self.indeces_conn_excel:
-            self.indeces_conn_excel.append(index)
+        key = (index.row(), index.column())
+        if key not in self.indeces_conn_excel:
+            self.indeces_conn_excel.add(key)
+            self.cellChanged(index, Qt.BackgroundColorRole)
     def removeIndecesConnExcel(self, index):
-        if index in self.indeces_conn_excel:
-            self.indeces_conn_excel.remove(index)
+        key = (index.row(), index.column())
+        if key in self.indeces_conn_excel:
+            self.indeces_conn_excel.remove(key)
+            self.cellChanged(index, Qt.BackgroundColorRole)
         
     def addIndecesDefaultValue(self, index):
-        if index not in self.indeces_default_value:
-            self.indeces_default_value.append(index)
+        key = (index.row(), index.column())
+        if key not in self.indeces_default_value:
+            self.indeces_default_value.add(key)
+            self.cellChanged(index, Qt.BackgroundColorRole)
     def removeIndecesDefaultValue(self, index):
-        if index in self.indeces_default_value:
-            self.indeces_default_value.remove(index)
+        key = (index.row(), index.column())
+        if key in self.indeces_default_value:
+            self.indeces_default_value.remove(key)
+            self.cellChanged(index, Qt.BackgroundColorRole)
 
     def data(self, index: QModelIndex, role: int):
         if role == Qt.DisplayRole:
-            row = index.row() + 1
-            col = index.column() + 1
-            value = self.sheet[get_column_letter(col)+str(row)].value
-            if value is not None:
-                return str(value)
-            else:
-                return ''
+            key = (index.row(), index.column())
+            text = self.display_cache.get(key)
+            if text is None:
+                value = self.sheet.cell(row=key[0] + 1, column=key[1] + 1).value
+                text = str(value) if value is not None else ''
+                self.display_cache[key] = text
+            return text
         if role == QtCore.Qt.BackgroundColorRole:
-            if index in self.indeces_conn_excel and index in self.indeces_default_value:
-                gradient = QtGui.QLinearGradient(0, 0, 60, 50)
-                gradient.setColorAt(0, Qt.green)
-                gradient.setColorAt(1, QtGui.QColor( 0xFF, 0xA0, 0x00 ))
-                
-                brush = QtGui.QBrush(gradient)
-                return brush
-            elif index in self.indeces_conn_excel:
-                brush = QtGui.QBrush(Qt.green)
-                return brush
-            elif index in self.indeces_default_value:
-                brush = QtGui.QBrush(QtGui.QColor( 0xFF, 0xA0, 0x00 ))
-                return brush
+            key = (index.row(), index.column())
+            conn_excel = key in self.indeces_conn_excel
+            default_value = key in self.indeces_default_value
+            if conn_excel and default_value:
+                return self.brush_both
+            elif conn_excel:
+                return self.brush_conn_excel
+            elif default_value:
+                return self.brush_default_value
             
 class DialogDragItemsMenu(QWidget):
     items_ready = QtCore.pyqtSignal(dict)
@@ -262,6 +313,58 @@ class DialogWidgetMenu(QWidget):
         self.move(pos)
         self.show()
 
+class CsvOptionsDialog(QtWidgets.QDialog):
+    """
+    Encoding and delimiter of a csv source. An empty value keeps the default:
+    utf-8 and a delimiter guessed from the first lines.
+    """
+    ENCODINGS = (('utf-8 (по умолчанию)', ''), ('cp1251 (Windows, выгрузки 1С и excel)', 'cp1251'),
+                 ('utf-16', 'utf-16'), ('cp866 (DOS)', 'cp866'), ('koi8-r', 'koi8-r'))
+    DELIMITERS = (('Определить по первой строке', ''), ('; (точка с запятой)', ';'), (', (запятая)', ','),
+                  ('Табуляция', '\t'), ('| (вертикальная черта)', '|'))
+
+    def __init__(self, path, encoding='', delimiter='', message='', parent=None):
+        super(CsvOptionsDialog, self).__init__(parent)
+        self.setWindowTitle('Чтение csv файла')
+        layout = QtWidgets.QVBoxLayout(self)
+
+        label = QtWidgets.QLabel((message + '\n\n' if message else '') + Path(path).name)
+        label.setWordWrap(True)
+        layout.addWidget(label)
+
+        form = QtWidgets.QFormLayout()
+        self.encoding = self.make_combo(self.ENCODINGS, encoding, editable=True)
+        self.delimiter = self.make_combo(self.DELIMITERS, delimiter)
+        form.addRow('Кодировка:', self.encoding)
+        form.addRow('Разделитель столбцов:', self.delimiter)
+        layout.addLayout(form)
+
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def make_combo(self, items, value, editable=False):
+        combo = QtWidgets.QComboBox()
+        combo.setEditable(editable)
+        for text, data in items:
+            combo.addItem(text, data)
+        index = combo.findData(value)
+        if index >= 0:
+            combo.setCurrentIndex(index)
+        else:
+            combo.setEditText(value)
+        return combo
+
+    def values(self):
+        # a typed in encoding has no data of its own
+        encoding = self.encoding.currentText().strip()
+        index = self.encoding.findText(encoding)
+        if index >= 0:
+            encoding = self.encoding.itemData(index)
+        return encoding, self.delimiter.currentData()
+
+
 class WheelBar(QTabBar):
     def __init__(self, parent: typing.Optional[QWidget] = ...) -> None:
         super().__init__()
@@ -309,4 +412,88 @@ class LicenseWindow(QWidget):
             geo = self.geometry()
             geo.moveCenter(self.parent.geometry().center())
             QtCore.QTimer.singleShot(0, lambda: self.setGeometry(geo))
-        
\ No newline at end of file
+
+class DivideWorker(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int, float, float, str)
+    finished = QtCore.pyqtSignal(int, bool)
+    failed = QtCore.pyqtSignal(str)
+    
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, divider, parent=None):
+        super(DivideWorker, self).__init__(parent)
+        self.divider = divider
+        self.started_at = 0.0
+        self.reported_at = 0.0
+        
+    def run(self):
+        self.started_at = time.perf_counter()
+        self.reported_at = 0.0
+        try:
+            count = self.divider.run(self.report_progress)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(count, self.divider.cancelled)
+        
+    def cancel(self):
+        self.divider.cancel()
+            
+    def report_progress(self, done, total, filename):
+        now = time.perf_counter()
+        if now - self.reported_at < self.PROGRESS_INTERVAL and done < total:
+            return
+        self.reported_at = now
+        
+        elapsed = now - self.started_at
+        rows_per_sec = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rows_per_sec if rows_per_sec > 0 else 0.0
+        self.progress.emit(done, total, rows_per_sec, eta, filename)
+
+
+class ProjectLoader(QtCore.QObject):
+    """
+    Opens the source and the template of a save in a thread. Like the window, it tries
+    the file next to the application first and then the full path from the save.
+    """
+    loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+    
+    def __init__(self, save, cache_dir, parent=None):
+        super(ProjectLoader, self).__init__(parent)
+        self.save = save
+        self.cache_dir = cache_dir
+        
+    def run(self):
+        try:
+            result = self.load()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(result)
+        
+    def candidates(self, path):
+        return [str(Path(Path(path).name).resolve()), str(Path(path).resolve())]
+        
+    def load(self) -> dict:
+        import engine
+        from openpyxl import load_workbook
+        from sources import open_source
+        
+        result = {'source' : None, 'pattern' : None}
+        for path in self.candidates(self.save['source_file']):
+            if engine.is_source_file(path):
+                try:
+                    source = open_source(path, self.save.get('source_encoding', ''),
+                                         self.save.get('source_delimiter', ''), self.cache_dir)
+                    result['source'] = (path, source, source.header())
+                except (UnicodeError, LookupError):
+                    # the window opens it once more and shows the error
+                    pass
+                break
+                
+        for path in self.candidates(self.save['pattern_file']):
+            if engine.is_excel_file(path):
+                result['pattern'] = (path, load_workbook(path))
+                break
+        return result
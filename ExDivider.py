@@ -13,33 +13,52 @@
 # You should have received a copy of the GNU General Public License 
 # along with Foobar. If not, see <https://www.gnu.org/licenses/>.
 
+import time
+STARTED_AT = time.perf_counter()
+
 import sys, os
 import datetime
 import json
 from pathlib import Path
 from configparser import ConfigParser
 
-from openpyxl import load_workbook, Workbook
-from openpyxl.utils import get_column_letter, column_index_from_string
-from openpyxl.utils.cell import coordinate_from_string
-
 from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QListView, QWidget, QMenu, QAction,\
     QInputDialog, QShortcut, QMessageBox
 from PyQt5.QtCore import Qt, QStringListModel, QVariant, QFileInfo
 
 from table import Ui_MainWindow
-from Components import DialogWidgetMenu, DialogWidgetMultipleMenu, LicenseWindow, WheelBar, SheetModel
+from Components import DialogWidgetMenu, DialogWidgetMultipleMenu, LicenseWindow, WheelBar, SheetModel, DivideWorker,\
+    ProjectLoader, EmptySheet, CsvOptionsDialog
+from sourcecache import SOURCE_CACHE_DIR
+
+# openpyxl and the engine take most of the start up time, so they are imported
+# on first use and the window is painted before them
+
+def load_workbook(path):
+    from openpyxl import load_workbook
+    return load_workbook(path)
 
-def replace_illegible_chars(value, deletechars):
-    for c in deletechars:
-        value = value.replace(c, '_')
-    return value;
+def get_column_letter(index):
+    from openpyxl.utils import get_column_letter
+    return get_column_letter(index)
+
+def column_index_from_string(letter):
+    from openpyxl.utils import column_index_from_string
+    return column_index_from_string(letter)
+
+def coordinate_from_string(coordinate):
+    from openpyxl.utils.cell import coordinate_from_string
+    return coordinate_from_string(coordinate)
 
 class Window(QMainWindow, Ui_MainWindow):
-    def __init__(self):
+    def __init__(self, measure_startup=False):
         super(Window, self).__init__()
         self.setupUi(self)
+        self.measure_startup = measure_startup
+        self.first_paint = None
+        self.loader = None
+        self.loader_thread = None
         
         self.icon = QtGui.QIcon(os.path.dirname(os.path.abspath(__file__)) + '/exdiv_icon.ico')
         
@@ -51,6 +70,9 @@ class Window(QMainWindow, Ui_MainWindow):
         self.button_select_source.clicked.connect(self.load_source_file)
         self.button_select_pattern.clicked.connect(self.load_pattern_file)
         self.button_start.clicked.connect(self.divide_source_file)
+        self.button_cancel.clicked.connect(self.cancel_divide)
+        self.worker = None
+        self.worker_thread = None
         
         self.action_new.triggered.connect(self.action_new_handler)
         self.action_save.triggered.connect(self.action_save_handler)
@@ -78,12 +100,21 @@ class Window(QMainWindow, Ui_MainWindow):
         self.license = LicenseWindow(self.icon, self)
         
         self.tabWidget.setTabBar(WheelBar())
+        self.tabWidget.tabBarClicked.connect(self.tab_clicked)
         
         listView = QListView()
         listView.setWordWrap(True)
         self.combo_box_cell.setView(listView)
         self.combo_box_cell.currentIndexChanged.connect(self.source_col_changed)
         
+    def paintEvent(self, event):
+        super(Window, self).paintEvent(event)
+        if self.first_paint is None:
+            self.first_paint = time.perf_counter() - STARTED_AT
+            # the recent project is restored once the empty window is on the screen
+            QtCore.QTimer.singleShot(0, self.restore_recent_save)
+            
+    def restore_recent_save(self):
         if Path("settings.ini").is_file():
             config = ConfigParser()
             config.read('settings.ini')
@@ -95,8 +126,16 @@ class Window(QMainWindow, Ui_MainWindow):
                 
             if Path(save_path).is_file():
                 self.action_load_handler(save_path)
-            else:
-                self.showWarning("Сохранения " + save_path +" не существует")
+                return
+            self.showWarning("Сохранения " + save_path +" не существует")
+        self.startup_finished()
+        
+    def startup_finished(self):
+        if not self.measure_startup:
+            return
+        self.measure_startup = False
+        print(json.dumps({'first_paint_s' : self.first_paint, 'restored_s' : time.perf_counter() - STARTED_AT}))
+        QApplication.quit()
                 
     def line_source_edited(self):
         if self.source_path == self.line_edit_source.text():
@@ -142,14 +181,16 @@ class Window(QMainWindow, Ui_MainWindow):
             self.add_data_to_template(self.excels_default_value, text, True)
             sheet_model = self.pattern_sheets[self.active_sheet_name]
             sheet_model.addIndecesDefaultValue(index)
-            sheet_model.endResetModel()
             
     def remove_default_value(self, index):
         self.active_cell = [index.row(), index.column()]
         self.add_data_to_template(self.excels_default_value, None, False)
         sheet_model = self.pattern_sheets[self.active_sheet_name]
         sheet_model.removeIndecesDefaultValue(index)
-        sheet_model.endResetModel()
+        key = self.active_cell_key()
+        if all(key not in mapping.get(self.active_sheet_name, {}) for mapping in
+               (self.excels_relation, self.excels_relation_many, self.excels_expressions)):
+            sheet_model.setData(index, QVariant(self.forget_original(self.active_sheet_name, key)), Qt.DisplayRole)
         
     def display_sheet(self, sheet_name):  
         self.active_sheet_name = sheet_name
@@ -185,19 +226,18 @@ class Window(QMainWindow, Ui_MainWindow):
         if row != 0:
             cell_value = QVariant(self.source_col_names[row])  
             sheet_model.addIndecesConnExcel(cell_index)
+            self.remember_original(self.active_sheet_name, self.active_cell_key())
             self.add_data_to_template(self.excels_relation_many, None, False)
+            self.add_data_to_template(self.excels_expressions, None, False)
             self.add_data_to_template(self.excels_relation, get_column_letter(row), True)
         else:
-            sheet = self.orig_pattern_wb[self.active_sheet_name]
-            act_row = self.active_cell[0] + 1
-            act_col = self.active_cell[1] + 1
-            cell_value = QVariant(sheet[get_column_letter(act_col)+str(act_row)].value) 
             sheet_model.removeIndecesConnExcel(cell_index)
             self.add_data_to_template(self.excels_relation_many, None, False)
+            self.add_data_to_template(self.excels_expressions, None, False)
             self.add_data_to_template(self.excels_relation, None, False)
+            cell_value = QVariant(self.forget_original(self.active_sheet_name, self.active_cell_key())) 
 
         sheet_model.setData(cell_index, cell_value, Qt.DisplayRole)
-        sheet_model.endResetModel()
         
     def set_cell_mult_names(self, dict_in):
         if len(self.active_cell) < 1:
@@ -208,50 +248,95 @@ class Window(QMainWindow, Ui_MainWindow):
         
         cell_value = QVariant(items)  
         sheet_model.addIndecesConnExcel(cell_index)
+        self.remember_original(self.active_sheet_name, self.active_cell_key())
         self.add_data_to_template(self.excels_relation, None, False)
+        self.add_data_to_template(self.excels_expressions, None, False)
         self.add_data_to_template(self.excels_relation_many, dict_in, True)
 
         sheet_model.setData(cell_index, cell_value, Qt.DisplayRole)
-        sheet_model.endResetModel()
+        
+    def active_cell_key(self) -> str:
+        return get_column_letter(self.active_cell[1] + 1) + str(self.active_cell[0] + 1)
+        
+    def remember_original(self, sheet_name, key):
+        originals = self.pattern_originals.setdefault(sheet_name, {})
+        if key not in originals:
+            originals[key] = self.pattern_wb[sheet_name][key].value
+            
+    def forget_original(self, sheet_name, key):
+        originals = self.pattern_originals.get(sheet_name, {})
+        value = originals.get(key, self.pattern_wb[sheet_name][key].value)
+        if all(key not in mapping.get(sheet_name, {}) for mapping in 
+               (self.excels_default_value, self.excels_relation, self.excels_relation_many, self.excels_expressions)):
+            originals.pop(key, None)
+        return value
         
     def add_data_to_template(self, dictionary_to, value, add):
         if len(self.active_cell) < 1:
             return
-        act_row = self.active_cell[0] + 1
-        act_col = self.active_cell[1] + 1
-        cell_excel_string = get_column_letter(act_col)+str(act_row)
+        cell_excel_string = self.active_cell_key()
         
         if add:
-            dictionary_to[self.active_sheet_name][cell_excel_string] = value
-        elif cell_excel_string in dictionary_to[self.active_sheet_name]:
+            dictionary_to.setdefault(self.active_sheet_name, {})[cell_excel_string] = value
+        elif cell_excel_string in dictionary_to.get(self.active_sheet_name, {}):
             del dictionary_to[self.active_sheet_name][cell_excel_string]
                     
     def load_source_file(self):
-        path, _ = QFileDialog.getOpenFileName(self, 'Откройте excel файл', str(Path().resolve()), '*.xlsx; *.xlsm; *.xltx; *.xltm')
-        if path == '' or self.source_path == path:
+        path, _ = QFileDialog.getOpenFileName(self, 'Откройте excel или csv файл', str(Path().resolve()),
+                                              '*.xlsx *.xlsm *.xltx *.xltm *.csv *.tsv *.txt')
+        from sources import is_csv_file
+        # a csv file can be opened again to read it in another encoding
+        if path == '' or (self.source_path == path and not is_csv_file(path)):
+            return
+        if is_csv_file(path) and not self.ask_csv_options(path):
             return
                 
         self.process_source_file(path)
         
-    def process_source_file(self, path, showWarning = True):
+    def ask_csv_options(self, path, message=''):
+        dialog = CsvOptionsDialog(path, self.source_encoding, self.source_delimiter, message, self)
+        dialog.setWindowIcon(self.icon)
+        if dialog.exec() != QtWidgets.QDialog.Accepted:
+            return False
+        self.source_encoding, self.source_delimiter = dialog.values()
+        return True
+        
+    def process_source_file(self, path, showWarning = True, loaded = None, refresh = True):
+        import engine
+        from sources import open_source
         path = str(Path(path).resolve())
         
-        if(self.is_excel_file(path)):
+        if(engine.is_source_file(path)):
+            try:
+                if loaded is not None:
+                    self.source, self.source_header = loaded
+                else:
+                    self.source = open_source(path, self.source_encoding, self.source_delimiter, SOURCE_CACHE_DIR)
+                    self.source_header = self.source.header()
+            except (UnicodeError, LookupError) as e:
+                self.source = None
+                self.source_header = []
+                from sources import is_csv_file
+                if showWarning and loaded is None and is_csv_file(path):
+                    if self.ask_csv_options(path, "Не удалось прочитать файл: " + str(e)):
+                        return self.process_source_file(path, showWarning, refresh=refresh)
+                if showWarning:
+                    self.line_edit_source.setStyleSheet("background-color: rgb(255, 179, 179);")
+                    self.showWarning("Не удалось прочитать файл " + path + ": " + str(e))
+                return False
             self.source_path = path
             self.line_edit_source.setText(path)
-            wb = load_workbook(path, data_only=True)
-            sheets = wb.sheetnames
-            self.source_ws = wb[sheets[0]]
             self.progress_bar.setValue(0)
             
-            self.refresh_list_items()
+            if refresh:
+                self.refresh_list_items()
 
             self.line_edit_source.setStyleSheet("background-color: rgb(176, 255, 170);")
             return True
         else:
             if showWarning:
                 self.line_edit_source.setStyleSheet("background-color: rgb(255, 179, 179);")
-                self.showWarning("Файл " + path + " не является excel файлом")
+                self.showWarning("Файл " + path + " не является excel или csv файлом")
             return False
         
     def load_pattern_file(self):
@@ -261,27 +346,29 @@ class Window(QMainWindow, Ui_MainWindow):
         
         self.process_pattern_file(path)
         
-    def process_pattern_file(self, path: str, showWarning = True):
+    def process_pattern_file(self, path: str, showWarning = True, wb = None, refresh = True):
         path = str(Path(path).resolve())
         
         if(self.is_excel_file(path)):
             self.excels_default_value = {}
             self.excels_relation = {}
             self.excels_relation_many = {}
+            self.excels_expressions = {}
             self.active_cell = []
             self.pattern_path = path
             self.line_edit_pattern.setText(path)
-            self.orig_pattern_wb = load_workbook(path)
-            self.pattern_wb = load_workbook(path)
+            self.pattern_wb = wb if wb is not None else load_workbook(path)
+            self.pattern_originals = {}
             self.tabs_names = self.pattern_wb.sheetnames
             for name in self.tabs_names:
                 self.excels_default_value[name] = {}           
                 self.excels_relation[name] = {}
                 self.excels_relation_many[name] = {}
             
-            self.refresh_tabs()
             self.progress_bar.setValue(0)
-            self.refresh_table()
+            if refresh:
+                self.refresh_tabs()
+                self.refresh_table()
 
             self.line_edit_pattern.setStyleSheet("background-color: rgb(176, 255, 170);")
             return True
@@ -292,10 +379,8 @@ class Window(QMainWindow, Ui_MainWindow):
             return False
         
     def is_excel_file(self, path: str) -> bool:
-        if(path != '' and Path(path).exists()):
-            return (path.endswith('.xlsx') or path.endswith('.xlsm') or path.endswith('.xltx') or path.endswith('.xltm'))
-        else:
-            return False
+        import engine
+        return engine.is_excel_file(path)
         
     def refresh_tabs(self):
         for _ in range(self.tabWidget.count()):
@@ -305,7 +390,6 @@ class Window(QMainWindow, Ui_MainWindow):
             tab = QWidget()
             tab.setObjectName(name)
             self.tabWidget.addTab(tab, name)
-            self.tabWidget.tabBarClicked.connect(self.tab_clicked)
             
             sheet = self.pattern_wb[name] 
             self.pattern_sheets[name] = SheetModel(sheet)
@@ -316,121 +400,146 @@ class Window(QMainWindow, Ui_MainWindow):
     def tab_clicked(self, index):
         self.display_sheet(self.tabs_names[index])
             
-    def refresh_list_items(self):
+    def refresh_list_items(self, refresh = True):
         self.source_col_names = []
         self.source_col_names.append('Не использовать')
-        if(self.source_ws and str(self.source_ws) != ''):
-            for col in range(1, self.source_ws.max_column + 1):
-                col_letter = get_column_letter(col)
-                if col_letter is not None and (self.source_ws[col_letter+'1'].value is not None or self.source_ws[col_letter+'1'].value != '' ):
-                    self.source_col_names.append(col_letter + ' ' + str(self.source_ws[col_letter+'1'].value))
-                elif col_letter is not None:
-                    self.source_col_names.append(col_letter)
+        for col, value in enumerate(self.source_header, 1):
+            self.source_col_names.append(get_column_letter(col) + ' ' + str(value))
         
         self.table_view_dialog.add_items(self.source_col_names)
         self.table_view_dialog_multiple.add_items(self.source_col_names)
         
         self.combo_box_cell.setModel(QStringListModel(self.source_col_names))
         self.combo_box_cell.setCurrentIndex(0)
-        self.refresh_table()
+        if refresh:
+            self.refresh_table()
         
+    def current_project(self):
+        from engine import Project
+        return Project(source_file=self.source_path,
+                       pattern_file=self.pattern_path,
+                       default_values=self.excels_default_value,
+                       relations=self.excels_relation,
+                       relations_many=self.excels_relation_many,
+                       expressions=self.excels_expressions,
+                       name_col_index=self.combo_box_cell.currentIndex(),
+                       add_name=str(self.line_edit_added.text()),
+                       check_name=self.check_box_added.isChecked(),
+                       source_encoding=self.source_encoding,
+                       source_delimiter=self.source_delimiter,
+                       row_from=self.row_from,
+                       row_to=self.row_to,
+                       row_filters=self.row_filters,
+                       shard=self.shard,
+                       group_by=self.group_by,
+                       repeat_rows=self.repeat_rows,
+                       lookups=self.lookups)
+
     def divide_source_file(self):
+        from engine import Divider, ProjectError
         self.progress_bar.setValue(0)
-        if self.source_path == '' or self.pattern_path == '':
-            msgWarning = QMessageBox()
-            msgWarning.setText("Для начала работы нужно чтобы поля источник информации и шаблон были заполнены"); 
-            msgWarning.setIcon(QMessageBox.Icon.Information);
-            msgWarning.setWindowTitle("Информация");
-            msgWarning.setWindowIcon(self.icon) 
-            msgWarning.exec();
-            return
-        if self.combo_box_cell.currentIndex() == 0 and not self.check_box_added.isChecked():
+        # the window keeps painting self.pattern_wb, so the worker reads the template into a workbook of its own
+        divider = Divider(self.current_project(), 'files', self.source)
+        try:
+            divider.validate()
+        except ProjectError as e:
             msgWarning = QMessageBox()
-            msgWarning.setText('Нужно выбрать поле "Использовать столбец как новые имена"'); 
+            msgWarning.setText(str(e)); 
             msgWarning.setIcon(QMessageBox.Icon.Information);
             msgWarning.setWindowTitle("Информация");
             msgWarning.setWindowIcon(self.icon) 
             msgWarning.exec();
             return
         
-        Path('files').mkdir(parents=True, exist_ok=True)
-        for i, row in enumerate(self.source_ws.iter_rows(min_row=2, values_only=True)):
-            for sheet in self.pattern_wb:
-                default_dict = self.excels_default_value[sheet.title]
-                for key in default_dict.keys():
-                    sheet[key] = default_dict[key]
-                    
-                sheet_dict = self.excels_relation[sheet.title]
-                for key in sheet_dict.keys():
-                    value = ''
-                    if len(row) < column_index_from_string(sheet_dict[key]):
-                        value = None
-                    else:
-                        value = row[column_index_from_string(sheet_dict[key]) - 1]
-                    
-                    if value is not None and str(value) != '':
-                        if isinstance(value, datetime.datetime):
-                            sheet[key] = str(value.strftime('%d.%m.%Y'))
-                        else:
-                            sheet[key] = str(value)
-                    elif key not in default_dict.keys():
-                        orig_sheet = self.orig_pattern_wb[sheet.title]
-                        sheet[key] = orig_sheet[key].value
-                
-                sheet_many_dict = self.excels_relation_many[sheet.title]
-                for key in sheet_many_dict.keys():
-                    comb_dict = sheet_many_dict[key]
-                    values = []
-                    for item in comb_dict['items']:
-                        value = ''
-                        if len(row) < column_index_from_string(item) + 1:
-                            value = None
-                        else:
-                            value = row[column_index_from_string(item) - 1]
-                        
-                        if isinstance(value, datetime.datetime):
-                            value = str(value.strftime('%d.%m.%Y'))
-                        else:
-                            value = str(value)
-                        if value != 'None' and value != '':
-                            values.append(value)
-                    values = comb_dict['delimeter'].join(x for x in values)
-                    sheet[key] = values
-                        
-            filename = ''
-            if self.combo_box_cell.currentIndex() != 0:
-                firstWord = str(self.combo_box_cell.currentText()).split(' ')[0]
-                column_index = column_index_from_string(firstWord) - 1
-                filename += replace_illegible_chars(str(row[column_index]), '\/:*?"<>|') 
-            
-            if self.check_box_added.isChecked() or filename is None or filename.replace(' ', '') == '':
-                filename += str(i)
-            if str(self.line_edit_added.text()) != '':
-                filename += str(self.line_edit_added.text())
-            filename = filename.replace('\n', ' ')
+        self.worker = DivideWorker(divider)
+        self.worker_thread = QtCore.QThread()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.progress.connect(self.divide_progress)
+        self.worker.finished.connect(self.divide_finished)
+        self.worker.failed.connect(self.divide_failed)
+        
+        self.set_running(True)
+        self.worker_thread.start()
+        
+    def cancel_divide(self):
+        if self.worker is not None:
+            self.button_cancel.setEnabled(False)
+            self.progress_bar.setFormat('Отмена после текущего файла...')
+            self.worker.cancel()
             
-            try:
-                self.pattern_wb.save('files/' + filename + '.xlsx')
-            except Exception:
-                self.pattern_wb.save('files/' + str(i) + '.xlsx')
-            
-            if i % 5 == 0:
-                self.progress_bar.setValue(int((i+1) / self.source_ws.max_row * 100))
-                
+    def divide_progress(self, done, total, rows_per_sec, eta, filename):
+        self.progress_bar.setValue(min(int(done / max(total, 1) * 100), 100))
+        if not self.button_cancel.isEnabled():
+            return
+        eta_text = str(datetime.timedelta(seconds=int(eta)))
+        self.progress_bar.setFormat('{} / {}   {:.1f} стр/с   осталось {}   {}.xlsx'.format(
+            done, total, rows_per_sec, eta_text, filename))
+        
+    def divide_finished(self, count, cancelled):
+        self.stop_worker()
         self.progress_bar.setValue(100)
         self.refresh_table()
         
         msgWarning = QMessageBox()
-        msgWarning.setText('Все файлы были созданы'); 
+        if cancelled:
+            msgWarning.setText('Создание файлов отменено. Создано файлов: ' + str(count)); 
+        else:
+            msgWarning.setText('Все файлы были созданы'); 
         msgWarning.setIcon(QMessageBox.Icon.NoIcon);
         msgWarning.setWindowTitle("Успех");
         msgWarning.setWindowIcon(self.icon) 
         msgWarning.exec();
         self.progress_bar.setValue(0)
+        
+    def divide_failed(self, message):
+        self.stop_worker()
+        self.progress_bar.setValue(0)
+        self.refresh_table()
+        self.showWarning(message)
+        
+    def stop_worker(self):
+        if self.worker_thread is not None:
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        self.worker = None
+        self.worker_thread = None
+        self.set_running(False)
+        
+    def set_running(self, running):
+        self.set_controls_enabled(not running)
+        self.button_cancel.setEnabled(running)
+        self.progress_bar.setTextVisible(running)
+        self.progress_bar.setFormat('')
+        
+    def set_loading(self, loading):
+        self.set_controls_enabled(not loading)
+        # a busy bar while the workbooks are parsed
+        self.progress_bar.setRange(0, 0 if loading else 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setTextVisible(loading)
+        self.progress_bar.setFormat('Загрузка сохранения...' if loading else '')
+        
+    def set_controls_enabled(self, enabled):
+        for widget in (self.button_start, self.button_select_source, self.button_select_pattern, 
+                       self.line_edit_source, self.line_edit_pattern, self.line_edit_added, 
+                       self.combo_box_cell, self.check_box_added, self.table_view, self.tabWidget, self.menuBar):
+            widget.setEnabled(enabled)
+        
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        if self.loader_thread is not None:
+            self.loader_thread.quit()
+            self.loader_thread.wait()
+        super(Window, self).closeEvent(event)
 
-                    
     def refresh_table(self):
+        from engine import expression_preview
         for sheet_name, sheet_model in self.pattern_sheets.items():
+            sheet_model.beginBatchReset()
             try:
                 _ = self.excels_default_value[sheet_name]
             except KeyError:
@@ -444,6 +553,7 @@ class Window(QMainWindow, Ui_MainWindow):
                 cell_column = column_index_from_string(beg_cell[0]) - 1
                 cell_index = sheet_model.index(cell_row, cell_column)
                 
+                self.remember_original(sheet_name, key)
                 cell_value = QVariant(None) 
                 sheet_model.setData(cell_index, cell_value, Qt.DisplayRole)
                 sheet_model.addIndecesDefaultValue(cell_index)
@@ -461,8 +571,10 @@ class Window(QMainWindow, Ui_MainWindow):
                 cell_column = column_index_from_string(beg_cell[0]) - 1
                 cell_index = sheet_model.index(cell_row, cell_column)
                 
+                self.remember_original(sheet_name, key)
                 cell_value = ''
-                if len(self.source_col_names) < column_index_from_string(value) + 1:
+                if ':' in value or len(self.source_col_names) < column_index_from_string(value) + 1:
+                    # a column of a lookup table, see engine.Lookup
                     cell_value = QVariant(value)
                 else:
                     cell_value = QVariant(self.source_col_names[column_index_from_string(value)]) 
@@ -482,19 +594,28 @@ class Window(QMainWindow, Ui_MainWindow):
                 cell_column = column_index_from_string(beg_cell[0]) - 1
                 cell_index = sheet_model.index(cell_row, cell_column)
                 
+                self.remember_original(sheet_name, key)
                 items = value['delimeter'].join(x for x in value['items'])
                 cell_value = QVariant(items) 
                 sheet_model.setData(cell_index, cell_value, Qt.DisplayRole)
                 sheet_model.addIndecesConnExcel(cell_index)
 
-            sheet_model.endResetModel()
+            for key, text in self.excels_expressions.get(sheet_name, {}).items():
+                beg_cell = coordinate_from_string(key)
+                cell_index = sheet_model.index(beg_cell[1] - 1, column_index_from_string(beg_cell[0]) - 1)
+
+                self.remember_original(sheet_name, key)
+                sheet_model.setData(cell_index, QVariant(expression_preview(str(text), self.source_header)), Qt.DisplayRole)
+                sheet_model.addIndecesConnExcel(cell_index)
+
+            sheet_model.endBatchReset()
 
     def action_about_handler(self):
         self.license.show()
         
     def action_new_handler(self):
         self.reset()
-        self.refresh_list_items()
+        self.refresh_list_items(refresh=False)
         self.refresh_tabs()
         self.progress_bar.setValue(0)
         self.refresh_table()
@@ -521,19 +642,7 @@ class Window(QMainWindow, Ui_MainWindow):
         with open('settings.ini', 'w', encoding='utf-8') as configfile:
             config.write(configfile)
         
-        data = {
-            'source_file' : self.source_path,
-            'pattern_file' : self.pattern_path,
-            'default_values' : self.excels_default_value,
-            'excels_connection' : self.excels_relation,
-            'excels_relation_many' : self.excels_relation_many,
-            'col_index_name' : str(self.combo_box_cell.currentIndex()),
-            'add_name' : str(self.line_edit_added.text()),
-            'check_name' : str(self.check_box_added.isChecked())
-            }
-            
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self.current_project().save(save_path)
                 
     def action_load_handler(self, file=None):
         if file is None or isinstance(file, bool):
@@ -557,27 +666,70 @@ class Window(QMainWindow, Ui_MainWindow):
                 _ = save['check_name']
             except KeyError:
                 self.showWarning("Неподходящее сохранение")
+                self.startup_finished()
                 return
             
             self.reset()
+            self.source_encoding = save.get('source_encoding', '')
+            self.source_delimiter = save.get('source_delimiter', '')
+            self.row_from = save.get('row_from', 0)
+            self.row_to = save.get('row_to', 0)
+            self.row_filters = save.get('row_filters', [])
+            self.shard = save.get('shard', '')
+            self.group_by = save.get('group_by', '')
+            self.repeat_rows = save.get('repeat_rows', {})
+            self.lookups = save.get('lookups', [])
             
-            sourceLoaded = True
-            if(not self.process_source_file(Path(save['source_file']).name, False)):
-                if not self.process_source_file(save['source_file']):
-                    sourceLoaded = False
-                
-            patternLoaded = True
-            if(not self.process_pattern_file(Path(save['pattern_file']).name, False)):
-                if not self.process_pattern_file(save['pattern_file']):
-                    patternLoaded = False
-                
-            # self.process_pattern_file(save['pattern_file'])
-            if patternLoaded:
-                self.excels_default_value = save['default_values']
-                self.excels_relation = save['excels_connection']
-                self.excels_relation_many = save['excels_relation_many']
+        # workbooks are parsed in the background, the window stays responsive meanwhile
+        self.loader = ProjectLoader(save, SOURCE_CACHE_DIR)
+        self.loader_thread = QtCore.QThread()
+        self.loader.moveToThread(self.loader_thread)
+        self.loader_thread.started.connect(self.loader.run)
+        self.loader.loaded.connect(lambda result: self.project_loaded(save, path, result))
+        self.loader.failed.connect(self.project_load_failed)
+        self.set_loading(True)
+        self.loader_thread.start()
+        
+    def stop_loader(self):
+        if self.loader_thread is not None:
+            self.loader_thread.quit()
+            self.loader_thread.wait()
+        self.loader = None
+        self.loader_thread = None
+        self.set_loading(False)
+        
+    def project_load_failed(self, message):
+        self.stop_loader()
+        self.showWarning(message)
+        self.startup_finished()
+        
+    def project_loaded(self, save, path, result):
+        self.stop_loader()
+        
+        # lists, tabs, models and the table are built once, after everything is known
+        sourceLoaded = True
+        if result['source'] is not None:
+            source_path, source, header = result['source']
+            self.process_source_file(source_path, loaded=(source, header), refresh=False)
+        elif not self.process_source_file(save['source_file'], refresh=False):
+            sourceLoaded = False
+            
+        patternLoaded = True
+        if result['pattern'] is not None:
+            pattern_path, wb = result['pattern']
+            self.process_pattern_file(pattern_path, wb=wb, refresh=False)
+        elif not self.process_pattern_file(save['pattern_file'], refresh=False):
+            patternLoaded = False
             
-            self.refresh_list_items()
+        if patternLoaded:
+            self.excels_default_value = save['default_values']
+            self.excels_relation = save['excels_connection']
+            self.excels_relation_many = save['excels_relation_many']
+            self.excels_expressions = save.get('expressions', {})
+        
+        self.setUpdatesEnabled(False)
+        try:
+            self.refresh_list_items(refresh=False)
             self.refresh_tabs()
             self.progress_bar.setValue(0)
             self.refresh_table()
@@ -589,9 +741,12 @@ class Window(QMainWindow, Ui_MainWindow):
                 
             self.line_edit_added.setText(save['add_name'])
             self.check_box_added.setChecked(save['check_name'] == "True")
-            
-            self.saves_path = str(Path(path).resolve())
-            self.save(self.saves_path)
+        finally:
+            self.setUpdatesEnabled(True)
+        
+        self.saves_path = str(Path(path).resolve())
+        self.save(self.saves_path)
+        self.startup_finished()
                 
     def reset(self):
         self.saves_path = ''
@@ -600,16 +755,27 @@ class Window(QMainWindow, Ui_MainWindow):
         self.excels_default_value = {}
         self.excels_relation = {}
         self.excels_relation_many = {}
+        self.excels_expressions = {}
         
         self.pattern_sheets = {}
         self.source_col_names = []
         self.current_source_columns = ''
-        self.orig_pattern_wb = ''
+        self.pattern_originals = {}
         self.pattern_wb = ''
         self.active_sheet_name = ''
         self.active_cell = []
         self.tabs_names = []
-        self.source_ws=''
+        self.source = None
+        self.source_header = []
+        self.source_encoding = ''
+        self.source_delimiter = ''
+        self.row_from = 0
+        self.row_to = 0
+        self.row_filters = []
+        self.shard = ''
+        self.group_by = ''
+        self.repeat_rows = {}
+        self.lookups = []
          
         self.progress_bar.setValue(0)
         self.line_edit_source.setText('')
@@ -617,7 +783,7 @@ class Window(QMainWindow, Ui_MainWindow):
         self.line_edit_pattern.setText('')
         self.line_edit_pattern.setStyleSheet("")
         
-        self.table_view.setModel(SheetModel(Workbook().create_sheet("Пустой")))
+        self.table_view.setModel(SheetModel(EmptySheet()))
         
     def showWarning(self, message):
         msgWarning = QMessageBox()
@@ -629,7 +795,8 @@ class Window(QMainWindow, Ui_MainWindow):
 
 def main():    
     app = QApplication(sys.argv)
-    wnd = Window()
+    # prints the time to the first paint and to the restored project, then exits
+    wnd = Window(measure_startup='--measure-startup' in sys.argv[1:])
     wnd.show()
     sys.exit(app.exec())
 
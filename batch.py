@@ -0,0 +1,281 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+# Runs many saved projects at once. Projects that share a source or a template
+# form one group: the group reads each of its workbooks once and runs its
+# projects on threads, separate groups run in separate processes.
+
+import sys
+import time
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from openpyxl import load_workbook
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from engine import Project, Divider, ProjectError, XmlPatchWriter, resolve_file, resolve_source, apply_filters
+from sources import open_source, RowsSource
+from writepool import WRITE_THREADS
+from sourcecache import SOURCE_CACHE_DIR
+
+JOB_THREADS = 4
+
+
+def error_text(e) -> str:
+    if isinstance(e, (ProjectError, OSError, UnicodeError, LookupError)):
+        return str(e)
+    # anything else is a fault of the save or of the program, its type helps to find it
+    return type(e).__name__ + ': ' + str(e)
+
+
+class Job:
+    def __init__(self, path, output_dir, rows=None, where=(), encoding=None, delimiter=None):
+        self.path = str(path)
+        self.row_range = rows
+        self.where = list(where)
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.name = Path(path).stem
+        self.output_dir = str(output_dir)
+        self.project = None
+        self.source_file = None
+        self.pattern_file = None
+        self.rows = 0
+        self.written = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.seconds = 0.0
+        self.error = None
+
+    def load(self):
+        try:
+            self.project = Project.load(self.path)
+            apply_filters(self.project, self.row_range, self.where, self.encoding, self.delimiter)
+            self.source_file = resolve_source(self.project.source_file)
+            self.pattern_file = resolve_file(self.project.pattern_file)
+        except Exception as e:
+            self.error = error_text(e)
+
+
+def group_jobs(jobs) -> list:
+    # connected by a common source or template file
+    parent = {}
+
+    def find(key):
+        while parent.setdefault(key, key) != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for job in jobs:
+        parent[find(('pattern', job.pattern_file))] = find(('source', job.source_file))
+
+    groups = {}
+    for job in jobs:
+        groups.setdefault(find(('source', job.source_file)), []).append(job)
+    return list(groups.values())
+
+
+def touched_cells(project, wb) -> list:
+    touched = []
+    for sheet in wb:
+        keys = set(project.default_values.get(sheet.title, {}))
+        keys.update(project.relations.get(sheet.title, {}), project.relations_many.get(sheet.title, {}),
+                    project.expressions.get(sheet.title, {}))
+        for key in keys:
+            position = coordinate_to_tuple(key)
+            cell = sheet._cells.get(position)
+            touched.append((sheet, position, cell is not None, None if cell is None else cell.value))
+    return touched
+
+
+def restore_cells(touched):
+    for sheet, position, existed, value in touched:
+        if existed:
+            sheet._cells[position].value = value
+        else:
+            sheet._cells.pop(position, None)
+
+
+class GroupRunner:
+    def __init__(self, jobs, writer='xml', threads=WRITE_THREADS, incremental=False):
+        self.jobs = jobs
+        self.writer = writer
+        self.threads = threads
+        self.incremental = incremental
+        self.sources = {}
+        self.patterns = {}
+
+    def source(self, job):
+        key = (job.source_file, job.project.source_encoding, job.project.source_delimiter)
+        if key not in self.sources:
+            source = open_source(*key, cache_dir=SOURCE_CACHE_DIR)
+            if sum(other.source_file == job.source_file for other in self.jobs) > 1:
+                source = RowsSource(source)
+            self.sources[key] = source
+        return self.sources[key]
+
+    def pattern(self, path):
+        if path not in self.patterns:
+            self.patterns[path] = load_workbook(path)
+        return self.patterns[path]
+
+    def prepare(self, job) -> Divider:
+        divider = Divider(job.project, job.output_dir, source=self.source(job),
+                          writer=self.writer, incremental=self.incremental, threads=self.threads)
+        divider.validate()
+        if self.writer == 'xml':
+            # the plan writes into the shared template, the xml writer keeps its own copy of the result
+            wb = self.pattern(job.pattern_file)
+            touched = touched_cells(job.project, wb)
+            divider.pattern_wb = wb
+            try:
+                divider.load()
+                divider.compile_plan()
+            finally:
+                restore_cells(touched)
+            if isinstance(divider.writer, XmlPatchWriter):
+                divider.pattern_wb = None
+                return divider
+            divider.writer = None
+        # the openpyxl writer changes its workbook for every row, so it needs one of its own
+        divider.pattern_wb = None
+        divider.load_pattern()
+        divider.load()
+        divider.compile_plan()
+        return divider
+
+    def run_job(self, job, divider):
+        start = time.perf_counter()
+        try:
+            job.rows = divider.run()
+            job.written, job.skipped, job.deleted = divider.written, divider.skipped, divider.deleted
+        except Exception as e:
+            # a broken save must not stop the other projects of the batch
+            job.error = error_text(e)
+        job.seconds = time.perf_counter() - start
+        return job
+
+    def run(self) -> list:
+        ready = []
+        for job in self.jobs:
+            try:
+                ready.append((job, self.prepare(job)))
+            except Exception as e:
+                job.error = error_text(e)
+
+        with ThreadPoolExecutor(min(JOB_THREADS, max(len(ready), 1))) as executor:
+            for future in [executor.submit(self.run_job, job, divider) for job, divider in ready]:
+                future.result()
+        return self.jobs
+
+
+def run_group(jobs, writer, threads, incremental) -> list:
+    return GroupRunner(jobs, writer, threads, incremental).run()
+
+
+def collect_jobs(paths, output_dir, rows=None, where=(), encoding=None, delimiter=None) -> list:
+    files = []
+    for path in paths:
+        path = Path(path)
+        files += sorted(path.glob('*.json')) if path.is_dir() else [path]
+
+    jobs = []
+    names = set()
+    for path in files:
+        name = path.stem
+        while name in names:
+            name += '_'
+        names.add(name)
+        jobs.append(Job(path, Path(output_dir) / name, rows, where, encoding, delimiter))
+    return jobs
+
+
+def run_batch(jobs, workers=1, writer='xml', threads=WRITE_THREADS, incremental=False) -> list:
+    for job in jobs:
+        job.load()
+    groups = group_jobs([job for job in jobs if job.error is None])
+
+    if workers > 1 and len(groups) > 1:
+        with ProcessPoolExecutor(min(workers, len(groups))) as executor:
+            futures = [(group, executor.submit(run_group, group, writer, threads, incremental)) for group in groups]
+            done = {}
+            for group, future in futures:
+                try:
+                    done.update((job.path, job) for job in future.result())
+                except Exception as e:
+                    # a process that died takes only its own group with it
+                    for job in group:
+                        job.error = error_text(e)
+        jobs = [done.get(job.path, job) for job in jobs]
+    else:
+        for group in groups:
+            run_group(group, writer, threads, incremental)
+    return jobs
+
+
+def print_summary(jobs, incremental=False):
+    width = max([len(job.name) for job in jobs] + [6])
+    columns = ['Строк', 'Создано'] + (['Без изменений', 'Удалено'] if incremental else []) + ['Время, с']
+    print('Проект'.ljust(width) + ''.join(column.rjust(len(column) + 2) for column in columns))
+    for job in jobs:
+        if job.error is not None:
+            print(job.name.ljust(width) + '  Ошибка: ' + job.error)
+            continue
+        values = [job.rows, job.written] + ([job.skipped, job.deleted] if incremental else [])
+        values.append('{:.2f}'.format(job.seconds))
+        print(job.name.ljust(width) + ''.join(str(value).rjust(len(column) + 2)
+                                              for value, column in zip(values, columns)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='exdivider-batch',
+                                     description='Создание excel файлов сразу по нескольким сохранениям')
+    parser.add_argument('projects', nargs='+', help='файлы сохранений (.json) или папки с ними, например saves')
+    parser.add_argument('-o', '--output', default='files',
+                        help='папка, в которой для каждого сохранения создаётся своя папка (по умолчанию "files")')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='число процессов, между которыми делятся группы сохранений (по умолчанию 1)')
+    parser.add_argument('-w', '--writer', choices=('xml', 'openpyxl'), default='xml',
+                        help='способ записи: xml (по умолчанию) или openpyxl')
+    parser.add_argument('-t', '--threads', type=int, default=WRITE_THREADS,
+                        help='число потоков записи файлов на диск для каждого сохранения')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='создавать только файлы, данные которых изменились с прошлого запуска')
+    parser.add_argument('--rows', help='только строки источника из диапазона, как в excel: 1200-1300')
+    parser.add_argument('--where', action='append', default=[],
+                        help='только строки, подходящие под условие, например D=Север; можно указать несколько раз')
+    parser.add_argument('--encoding', help='кодировка источников csv вместо указанной в сохранениях, например cp1251')
+    parser.add_argument('--delimiter',
+                        help='разделитель столбцов источников csv вместо указанного в сохранениях, например ";" или tab')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = collect_jobs(args.projects, args.output, args.rows, args.where, args.encoding, args.delimiter)
+    if not jobs:
+        print('Ошибка: не найдено ни одного сохранения', file=sys.stderr)
+        return 1
+
+    jobs = run_batch(jobs, args.workers, args.writer, args.threads, args.incremental)
+    print_summary(jobs, args.incremental)
+    return 1 if any(job.error is not None for job in jobs) else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+# python -m benchmarks.compare old.json new.json
+
+import sys
+import json
+
+SECTIONS = ('source', 'template', 'fill_save', 'end_to_end', 'sheet_model', 'startup')
+
+
+def flatten(results) -> dict:
+    metrics = {}
+    for section in SECTIONS:
+        entries = results.get(section)
+        if entries is None:
+            continue
+        if isinstance(entries, dict):
+            entries = [entries]
+        for entry in entries:
+            prefix = section + ('.' + entry['writer'] if 'writer' in entry else '')
+            for key, value in entry.items():
+                if isinstance(value, float):
+                    metrics[prefix + '.' + key] = value
+    return metrics
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print('python -m benchmarks.compare old.json new.json', file=sys.stderr)
+        return 2
+
+    with open(argv[0], encoding='utf-8') as f:
+        old = flatten(json.load(f))
+    with open(argv[1], encoding='utf-8') as f:
+        new = flatten(json.load(f))
+
+    for name in sorted(old.keys() & new.keys()):
+        change = (new[name] / old[name] - 1) * 100 if old[name] else 0.0
+        print('{:<45} {:>14.4f} {:>14.4f} {:>+9.1f}%'.format(name, old[name], new[name], change))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
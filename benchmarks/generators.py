@@ -0,0 +1,101 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import random
+import datetime
+
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+from openpyxl.utils import get_column_letter
+
+DATA_TYPES = ('text', 'number', 'date', 'long_text')
+
+WORDS = ('alpha', 'beta', 'gamma', 'delta', 'north', 'south', 'east', 'west', 'invoice', 'branch',
+         'region', 'total', 'client', 'order', 'report', 'счёт', 'филиал', 'отчёт', 'клиент', 'сумма')
+
+
+def make_value(rnd: random.Random, data_type: str):
+    if data_type == 'number':
+        return round(rnd.uniform(0, 100000), 2)
+    if data_type == 'date':
+        return datetime.datetime(2020, 1, 1) + datetime.timedelta(days=rnd.randrange(2000))
+    if data_type == 'long_text':
+        return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randrange(40, 120)))
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randrange(1, 4)))
+
+
+def make_source(path, rows=1000, columns=10, data_types=DATA_TYPES, seed=0):
+    rnd = random.Random(seed)
+    column_types = [data_types[col % len(data_types)] for col in range(columns)]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Data')
+    ws.append(['{} {}'.format(column_type, col + 1) for col, column_type in enumerate(column_types)])
+    for _ in range(rows):
+        ws.append([make_value(rnd, column_type) for column_type in column_types])
+    wb.save(path)
+    return column_types
+
+
+def make_template(path, sheets=3, rows=100, columns=10, merged=10, styled=True, mapped=10, source_columns=10, seed=0,
+                  blank_mapped=True):
+    """
+    mapped is the number of mapped cells per sheet, one in ten of them joins
+    several columns. With blank_mapped the mapped cells have neither a value nor
+    a style, like the fill-in cells of a real template. Returns (relations,
+    relations_many) for the project.
+    """
+    rnd = random.Random(seed)
+    border = Border(*(Side(style='thin'),) * 4)
+    fills = [PatternFill('solid', fgColor=color) for color in ('FFF2CC', 'DDEBF7', 'E2EFDA')]
+
+    wb = Workbook()
+    wb.remove(wb.active)
+    relations = {}
+    relations_many = {}
+    for index in range(sheets):
+        ws = wb.create_sheet('Sheet{}'.format(index + 1))
+        relations[ws.title] = {}
+        relations_many[ws.title] = {}
+        for row in range(1, rows + 1):
+            for col in range(1, columns + 1):
+                cell = ws.cell(row=row, column=col, value=make_value(rnd, 'text' if col % 3 else 'number'))
+                if styled:
+                    cell.font = Font(bold=row == 1, italic=col % 4 == 0)
+                    cell.border = border
+                    cell.fill = fills[(row + col) % len(fills)]
+                    cell.alignment = Alignment(wrap_text=col % 2 == 0)
+
+        for _ in range(merged):
+            row = rnd.randrange(1, max(rows - 2, 2))
+            col = rnd.randrange(1, max(columns - 2, 2))
+            ws.merge_cells(start_row=row, start_column=col, end_row=row + 1, end_column=col + 1)
+
+        # merged cells are left alone, only the top left one of them could hold a value
+        merged_cells = {cell for cells in ws.merged_cells.ranges for cell in cells.cells}
+        free = [(row, col) for row in range(1, rows + 1) for col in range(1, columns + 1)
+                if (row, col) not in merged_cells]
+        for number, (row, col) in enumerate(rnd.sample(free, min(mapped, len(free)))):
+            key = get_column_letter(col) + str(row)
+            if blank_mapped:
+                del ws._cells[(row, col)]
+            if number % 10 == 9:
+                items = [get_column_letter(c % source_columns + 1) for c in range(number, number + 3)]
+                relations_many[ws.title][key] = {'items' : items, 'delimeter' : ', '}
+            else:
+                relations[ws.title][key] = get_column_letter(number % source_columns + 1)
+
+    wb.save(path)
+    return relations, relations_many
@@ -0,0 +1,220 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import platform
+import argparse
+import tempfile
+import datetime
+from pathlib import Path
+
+import openpyxl
+from openpyxl import load_workbook
+
+from engine import Project, Divider
+from sources import ExcelSource
+from benchmarks.generators import make_source, make_template, DATA_TYPES
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Замеры скорости ExDivider')
+    parser.add_argument('--rows', type=int, default=1000, help='строк в источнике')
+    parser.add_argument('--columns', type=int, default=10, help='столбцов в источнике')
+    parser.add_argument('--types', default=','.join(DATA_TYPES), help='типы данных столбцов: ' + ', '.join(DATA_TYPES))
+    parser.add_argument('--sheets', type=int, default=3, help='листов в шаблоне')
+    parser.add_argument('--template-rows', type=int, default=100)
+    parser.add_argument('--template-columns', type=int, default=10)
+    parser.add_argument('--merged', type=int, default=10, help='объединённых ячеек на лист')
+    parser.add_argument('--mapped', type=int, default=10, help='связанных ячеек на лист')
+    parser.add_argument('--no-styles', action='store_true')
+    parser.add_argument('--filled-mapped', action='store_true',
+                        help='оставить в связанных ячейках шаблона значения и стили (по умолчанию они пустые)')
+    parser.add_argument('--sample', type=int, default=100, help='строк для замера заполнения и сохранения')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--writers', default='xml,openpyxl')
+    parser.add_argument('--no-gui', action='store_true', help='не замерять отрисовку SheetModel')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work', help='папка для созданных файлов (по умолчанию временная)')
+    parser.add_argument('--out', default='bench_results.json')
+    return parser.parse_args(argv)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def per_second(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+
+def bench_source(path):
+    header_time, source = timed(lambda: ExcelSource(str(path)))
+    header_time += timed(source.header)[0]
+    stream_time, count = timed(lambda: sum(1 for _ in source.iter_rows()))
+    return {
+        'header_s' : header_time,
+        'stream_s' : stream_time,
+        'rows' : count,
+        'rows_per_s' : per_second(count, stream_time)
+        }
+
+
+def bench_template(path):
+    load_time, _ = timed(load_workbook, str(path))
+    return {'load_s' : load_time}
+
+
+def bench_fill_save(project, work, writer, sample):
+    out = work / ('sample_' + writer)
+    out.mkdir(exist_ok=True)
+    divider = Divider(project, out, writer=writer)
+    divider.load()
+    prepare_time, _ = timed(divider.compile_plan)
+
+    rows = []
+    for row in divider.source.iter_rows():
+        rows.append(row)
+        if len(rows) == sample:
+            break
+
+    fill_time = 0.0
+    save_time = 0.0
+    for i, row in enumerate(rows):
+        seconds, values = timed(divider.plan.evaluate, row)
+        fill_time += seconds
+        save_time += timed(divider.writer.write, values, str(out / (str(i) + '.xlsx')))[0]
+    return {
+        'writer' : writer,
+        'writer_used' : divider.writer_used(),
+        'prepare_s' : prepare_time,
+        'rows' : len(rows),
+        'fill_ms_per_row' : fill_time / max(len(rows), 1) * 1000,
+        'save_ms_per_row' : save_time / max(len(rows), 1) * 1000
+        }
+
+
+def bench_end_to_end(project, work, writer, workers):
+    out = work / ('run_' + writer)
+    divider = Divider(project, out, workers=workers, writer=writer)
+    seconds, count = timed(divider.run)
+    return {
+        'writer' : writer,
+        'writer_used' : divider.writer_used(),
+        'workers' : workers,
+        'total_s' : seconds,
+        'files' : count,
+        'files_per_s' : per_second(count, seconds)
+        }
+
+
+def bench_sheet_model(path):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtCore import Qt
+        from Components import SheetModel
+    except ImportError:
+        return None
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    ws = load_workbook(str(path)).worksheets[0]
+    model = SheetModel(ws)
+    indexes = [model.index(row, col) for row in range(model.rowCount()) for col in range(model.columnCount())]
+    for index in indexes[::7]:
+        model.addIndecesConnExcel(index)
+
+    def paint():
+        for index in indexes:
+            model.data(index, Qt.DisplayRole)
+            model.data(index, Qt.BackgroundColorRole)
+
+    cold, _ = timed(paint)
+    warm, _ = timed(paint)
+    return {
+        'cells' : len(indexes),
+        'first_paint_ms' : cold * 1000,
+        'repaint_ms' : warm * 1000
+        }
+
+
+def bench_startup(work, project_path):
+    # the application itself, started with the project as the recent save
+    script = Path(__file__).resolve().parent.parent / 'ExDivider.py'
+    (work / 'settings.ini').write_text('[Info]\nrecent_save = ' + str(project_path) + '\n', encoding='utf-8')
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    try:
+        output = subprocess.run([sys.executable, str(script), '--measure-startup'], cwd=str(work), env=env,
+                                capture_output=True, text=True, timeout=600).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    except (OSError, ValueError, IndexError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    return {
+        'date' : datetime.datetime.now().isoformat(timespec='seconds'),
+        'python' : platform.python_version(),
+        'openpyxl' : openpyxl.__version__,
+        'platform' : platform.platform(),
+        'cpu_count' : os.cpu_count()
+        }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work = Path(args.work or tempfile.mkdtemp(prefix='exdivider_bench_')).resolve()
+    work.mkdir(parents=True, exist_ok=True)
+
+    source_path = work / 'bench_source.xlsx'
+    pattern_path = work / 'bench_pattern.xlsx'
+    types = tuple(t for t in args.types.split(',') if t)
+    generate_source, _ = timed(make_source, source_path, args.rows, args.columns, types, args.seed)
+    generate_template, (relations, relations_many) = timed(
+        make_template, pattern_path, args.sheets, args.template_rows, args.template_columns, args.merged,
+        not args.no_styles, args.mapped, args.columns, args.seed, not args.filled_mapped)
+
+    project = Project(source_file=str(source_path), pattern_file=str(pattern_path),
+                      default_values={}, relations=relations, relations_many=relations_many,
+                      name_col_index=0, add_name='', check_name=True)
+    project.save(str(work / 'bench_project.json'))
+
+    writers = [w for w in args.writers.split(',') if w]
+    results = {
+        'params' : vars(args),
+        'environment' : environment(),
+        'generate_s' : {'source' : generate_source, 'template' : generate_template},
+        'source' : bench_source(source_path),
+        'template' : bench_template(pattern_path),
+        'fill_save' : [bench_fill_save(project, work, writer, args.sample) for writer in writers],
+        'end_to_end' : [bench_end_to_end(project, work, writer, args.workers) for writer in writers],
+        'sheet_model' : None if args.no_gui else bench_sheet_model(pattern_path),
+        'startup' : None if args.no_gui else bench_startup(work, work / 'bench_project.json')
+        }
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    print(json.dumps({key : results[key] for key in ('source', 'template', 'fill_save', 'end_to_end', 'sheet_model', 'startup')},
+                     ensure_ascii=False, indent=4))
+
+    if not args.work:
+        shutil.rmtree(work, ignore_errors=True)
+    return 0
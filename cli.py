@@ -0,0 +1,133 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import re
+import sys
+import argparse
+import multiprocessing
+
+from engine import Project, Divider, ProjectError, apply_filters
+from sourcecache import SOURCE_CACHE_DIR
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='exdivider',
+                                     description='Создание excel файлов по шаблону без графического интерфейса')
+    parser.add_argument('project', help='файл сохранения (.json), созданный в ExDivider')
+    parser.add_argument('-o', '--output', default='files', help='папка для новых файлов (по умолчанию "files")')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='число процессов для параллельного создания файлов (по умолчанию 1)')
+    parser.add_argument('-w', '--writer', choices=('xml', 'openpyxl'), default='xml',
+                        help='способ записи: xml (по умолчанию) меняет в шаблоне только связанные ячейки, '
+                             'openpyxl сохраняет книгу целиком')
+    parser.add_argument('-t', '--threads', type=int, default=4,
+                        help='число потоков, записывающих готовые файлы на диск (0 - писать без потоков)')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='создавать только файлы, данные которых изменились с прошлого запуска, '
+                             'и удалять файлы строк, которых больше нет в источнике')
+    parser.add_argument('--rows', help='только строки источника из диапазона, как в excel: 1200-1300, 1200- или -1300')
+    parser.add_argument('--where', action='append', default=[],
+                        help='только строки, подходящие под условие, например D=Север, D!=Север, D~Сев, E>=100; '
+                             'можно указать несколько раз')
+    parser.add_argument('--encoding',
+                        help='кодировка источника csv вместо указанной в сохранении, например cp1251')
+    parser.add_argument('--delimiter',
+                        help='разделитель столбцов источника csv вместо указанного в сохранении, например ";" или tab')
+    parser.add_argument('--group-by', metavar='COLUMN',
+                        help='один файл на все строки с одинаковым значением столбца, например D')
+    parser.add_argument('--repeat', action='append', default=[], metavar='SHEET:ROWS',
+                        help='строки шаблона, повторяемые для каждой строки группы, например Счёт:5-7; '
+                             'можно указать для нескольких листов')
+    parser.add_argument('--shard',
+                        help='раскладывать файлы по подпапкам: column:D (по значению столбца, column:D/E - вложенные), '
+                             'hash:2 (по первым знакам хеша имени) или count:1000 (по 1000 строк в папке)')
+    parser.add_argument('--index', action='store_true',
+                        help='записать рядом с папкой результатов список "строка - файл" (files.index.csv), '
+                             'при разбиении на подпапки он записывается всегда')
+    parser.add_argument('--archive',
+                        help='записать файлы не в папку, а в один zip архив, например files.zip')
+    parser.add_argument('--archive-files', type=int, default=0,
+                        help='делить архив на части не больше чем по столько файлов: files.001.zip, files.002.zip...')
+    parser.add_argument('--archive-size', type=parse_size, default=0,
+                        help='делить архив на части не больше этого размера, например 500M или 2G')
+    parser.add_argument('--dedup', choices=('link', 'copy'),
+                        help='строки с теми же значениями, что у одной из прошлых строк, не сохранять заново, '
+                             'а сделать жёсткую ссылку (link) или копию (copy) уже созданного файла')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='не использовать и не создавать кэш прочитанного источника (папка cache)')
+    parser.add_argument('-r', '--report', action='store_true',
+                        help='записать рядом с папкой результатов отчёт о времени этапов (files.report.json)')
+    parser.add_argument('--profile', choices=('cprofile', 'tracemalloc'),
+                        help='дополнительно снять профиль cProfile или распределение памяти tracemalloc')
+    parser.add_argument('-q', '--quiet', action='store_true', help='не выводить прогресс')
+    return parser.parse_args(argv)
+
+
+def parse_size(text):
+    # "500M", "2G", "100000" in bytes
+    match = re.fullmatch(r'\s*(\d+(?:[.,]\d+)?)\s*([KMG]?)B?\s*', text.upper())
+    if match is None:
+        raise argparse.ArgumentTypeError('неверный размер: ' + text)
+    return int(float(match.group(1).replace(',', '.')) * 1024 ** ' KMG'.index(match.group(2) or ' '))
+
+
+def print_progress(done, total, filename):
+    if done % 100 == 0 or done == total:
+        print('\r{} / {}'.format(done, total), end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    try:
+        project = Project.load(args.project)
+        apply_filters(project, args.rows, args.where, args.encoding, args.delimiter)
+        if args.shard is not None:
+            project.shard = args.shard
+        if args.group_by is not None:
+            project.group_by = args.group_by
+        if args.repeat:
+            project.repeat_rows = dict(project.repeat_rows)
+        for text in args.repeat:
+            sheet, _, rows = text.rpartition(':')
+            project.repeat_rows[sheet] = rows
+        divider = Divider(project, args.output, workers=args.workers, writer=args.writer,
+                          incremental=args.incremental, report=args.report, profile=args.profile,
+                          threads=args.threads, source_cache=None if args.no_cache else SOURCE_CACHE_DIR,
+                          index=args.index, archive=args.archive, archive_files=args.archive_files,
+                          archive_bytes=args.archive_size, dedup=args.dedup)
+        count = divider.run(None if args.quiet else print_progress)
+    except (ProjectError, OSError, UnicodeError) as e:
+        print('\nОшибка: ' + str(e), file=sys.stderr)
+        return 1
+
+    if not args.quiet:
+        print('', file=sys.stderr)
+    print('Обработано строк: ' + str(count))
+    print('Создано файлов: ' + str(divider.written))
+    if divider.writer_used() != args.writer:
+        print('Способ записи: ' + divider.writer_used())
+    if divider.linked:
+        print('Из них без сохранения, как копии одинаковых файлов: ' + str(divider.linked))
+    if divider.filtered:
+        print('Не подошло под условия: ' + str(divider.filtered))
+    if args.incremental:
+        print('Без изменений: ' + str(divider.skipped))
+        print('Удалено файлов: ' + str(divider.deleted))
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,1336 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import re
+import codecs
+import time
+import datetime
+import json
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.writer.excel import ExcelWriter
+
+from xlsxpatch import PatchTemplate
+from rowexpand import RowExpansion
+from sources import open_source, CSV_SUFFIXES
+from sourcecache import SOURCE_CACHE_DIR
+from manifest import Manifest, RowIndex, manifest_path, index_path, config_key, values_key
+from profiling import PhaseTimer, Profiler, PROFILERS, report_path, write_report
+from writepool import WriterPool, HandOver, ZipArchive, WRITE_THREADS
+
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm', '.xltx', '.xltm')
+ILLEGIBLE_CHARS = r'\/:*?"<>|'
+DATE_FORMAT = '%d.%m.%Y'
+CHUNK_SIZE = 32
+FILTER_OPS = ('=', '!=', '~', '<', '<=', '>', '>=')
+SHARD_MODES = ('column', 'hash', 'count')
+DEDUP_MODES = (None, 'link', 'copy')
+EXPRESSION_FIELD = re.compile(r'\{\{|\}\}|\{([^{}]*)\}')
+
+SAVE_KEYS = ('source_file', 'pattern_file', 'default_values', 'excels_connection', 'excels_relation_many',
+             'col_index_name', 'add_name', 'check_name')
+
+
+class ProjectError(Exception):
+    pass
+
+
+def replace_illegible_chars(value, deletechars):
+    for c in deletechars:
+        value = value.replace(c, '_')
+    return value
+
+
+def is_excel_file(path: str) -> bool:
+    if path != '' and Path(path).exists():
+        return str(path).endswith(EXCEL_SUFFIXES)
+    return False
+
+
+def is_source_file(path: str) -> bool:
+    if path != '' and Path(path).exists():
+        return str(path).lower().endswith(EXCEL_SUFFIXES + CSV_SUFFIXES)
+    return False
+
+
+def resolve_file(path: str) -> str:
+    # the file next to the application wins, as in Window.action_load_handler
+    if is_excel_file(Path(path).name):
+        return str(Path(Path(path).name).resolve())
+    if is_excel_file(path):
+        return str(Path(path).resolve())
+    raise ProjectError("Файл " + str(path) + " не является excel файлом")
+
+
+def resolve_source(path: str) -> str:
+    if is_source_file(Path(path).name):
+        return str(Path(Path(path).name).resolve())
+    if is_source_file(path):
+        return str(Path(path).resolve())
+    raise ProjectError("Файл " + str(path) + " не является excel или csv файлом")
+
+
+def cell_to_str(value):
+    if isinstance(value, datetime.datetime):
+        return str(value.strftime(DATE_FORMAT))
+    return str(value)
+
+
+def parse_row_range(text: str):
+    # "1200-1300", "1200-" or "-1300", numbers as in excel
+    match = re.fullmatch(r'\s*(\d*)\s*(-?)\s*(\d*)\s*', text)
+    if match is None or not (match.group(1) or match.group(3)):
+        raise ProjectError("Неверный диапазон строк: " + text)
+    row_from = int(match.group(1)) if match.group(1) else 0
+    if match.group(2):
+        row_to = int(match.group(3)) if match.group(3) else 0
+    else:
+        row_to = row_from
+    return row_from, row_to
+
+
+def parse_delimiter(text: str) -> str:
+    # one character, a tab can be written as "tab" or "\t"
+    delimiter = {'tab' : '\t', '\\t' : '\t'}.get(text.lower(), text)
+    if len(delimiter) != 1:
+        raise ProjectError("Разделитель должен быть одним символом: " + text)
+    return delimiter
+
+
+def parse_condition(text: str) -> dict:
+    # "D=North", "D!=North", "D~Nor", "E>=100"
+    match = re.fullmatch(r'\s*([A-Za-z]{1,3})\s*(!=|<=|>=|=|~|<|>)(.*)', text)
+    if match is None:
+        raise ProjectError("Неверное условие отбора строк: " + text)
+    return {'column' : match.group(1).upper(), 'op' : match.group(2), 'value' : match.group(3)}
+
+
+def to_number(value):
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def compile_condition(condition: dict):
+    try:
+        col = column_index_from_string(str(condition['column']).upper()) - 1
+        op = condition.get('op', '=')
+        expected = condition.get('value', '')
+    except (KeyError, ValueError, AttributeError, TypeError):
+        raise ProjectError("Неверное условие отбора строк: " + str(condition))
+    if op not in FILTER_OPS:
+        raise ProjectError("Неизвестное сравнение в условии отбора строк: " + str(op))
+
+    expected = [str(item) for item in expected] if isinstance(expected, list) else [str(expected)]
+    numbers = [to_number(item) for item in expected]
+
+    def text(row):
+        value = row[col] if col < len(row) else None
+        return '' if value is None else cell_to_str(value)
+
+    def equal(value):
+        number = to_number(value)
+        for item, item_number in zip(expected, numbers):
+            if value == item or (number is not None and number == item_number):
+                return True
+        return False
+
+    if op == '=':
+        return lambda row: equal(text(row))
+    if op == '!=':
+        return lambda row: not equal(text(row))
+    if op == '~':
+        return lambda row: any(item in text(row) for item in expected)
+
+    compare = {'<' : float.__lt__, '<=' : float.__le__, '>' : float.__gt__, '>=' : float.__ge__}[op]
+    limit = numbers[0]
+    if limit is None:
+        raise ProjectError("В условии " + op + " нужно число: " + expected[0])
+
+    def test(row):
+        number = to_number(text(row))
+        return number is not None and compare(number, limit)
+    return test
+
+
+def unmatched_text(text, start, end) -> str:
+    piece = text[start:end]
+    if '{' in piece or '}' in piece:
+        raise ProjectError("Неверное выражение, непарная скобка: " + text)
+    return piece
+
+
+def parse_expression(text: str) -> list:
+    """
+    "{B} {C|upper} {D|date:%Y-%m-%d} {E|num:0.00}" as a list of text pieces and fields,
+    a field is (reference, [(filter, argument)]). "{{" and "}}" stand for braces.
+    """
+    parts = []
+    literal = ''
+    position = 0
+    for match in EXPRESSION_FIELD.finditer(text):
+        literal += unmatched_text(text, position, match.start())
+        position = match.end()
+        if match.group(1) is None:
+            literal += match.group(0)[0]
+            continue
+        if literal:
+            parts.append(literal)
+            literal = ''
+        reference, *filters = match.group(1).split('|')
+        parts.append((parse_reference(reference),
+                      [(name.strip().lower(), argument) for name, _, argument in
+                       (item.partition(':') for item in filters)]))
+    literal += unmatched_text(text, position, len(text))
+    if literal:
+        parts.append(literal)
+    return parts
+
+
+def compile_number(pattern: str):
+    # excel like "0", "0.00", "# ##0,00" or "#,##0.00"
+    match = re.fullmatch(r'[#0]+(?:([ ,\u00a0])[#0]{3})?(?:([.,])(0+))?', pattern.strip())
+    if match is None:
+        raise ProjectError("Неверный формат числа: " + pattern)
+    group, point, decimals = match.group(1) or '', match.group(2) or '.', len(match.group(3) or '')
+
+    def number(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            parsed = to_number(value)
+            if parsed is None:
+                # not a number, the text stays as it is
+                return value
+            value = parsed
+        text = '{:,.{}f}'.format(value, decimals)
+        return text.replace(',', '\0').replace('.', point).replace('\0', group)
+    return number
+
+
+def compile_filter(name: str, argument: str):
+    if name in ('upper', 'lower', 'title', 'strip'):
+        method = getattr(str, name)
+        return lambda value: None if value is None else method(cell_to_str(value))
+    if name == 'date':
+        date_format = argument or DATE_FORMAT
+        return lambda value: value.strftime(date_format) if isinstance(value, (datetime.date, datetime.time)) else value
+    if name == 'num':
+        number = compile_number(argument or '0')
+        return lambda value: number(value) if value is not None and value != '' else value
+    if name == 'default':
+        return lambda value: argument if value is None or value == '' else value
+    raise ProjectError("Неизвестный фильтр в выражении: " + name)
+
+
+def compile_expression(parts: list, column):
+    """
+    Turns a parsed expression into one function of the row, column() gives the index
+    of a reference in the row. Filters are looked up here, not for every row.
+    """
+    pieces = []
+    for part in parts:
+        if isinstance(part, str):
+            pieces.append(lambda row, text=part: text)
+            continue
+        reference, filters = part
+        col = column(reference)
+        functions = [compile_filter(name, argument) for name, argument in filters]
+
+        def field(row, col=col, functions=functions):
+            value = row[col] if col < len(row) else None
+            for function in functions:
+                value = function(value)
+            return '' if value is None else cell_to_str(value)
+        pieces.append(field)
+
+    if len(pieces) == 1:
+        return pieces[0]
+    return lambda row: ''.join([piece(row) for piece in pieces])
+
+
+def expression_preview(text: str, header) -> str:
+    # the expression with column names of the source instead of letters, as the window shows mappings
+    try:
+        parts = parse_expression(text)
+    except ProjectError:
+        return text
+    preview = ''
+    for part in parts:
+        if isinstance(part, str):
+            preview += part.replace('{', '{{').replace('}', '}}')
+            continue
+        (name, col), filters = part
+        if name is None and col < len(header) and header[col] not in (None, ''):
+            label = str(header[col])
+        else:
+            label = (name + ':' if name is not None else '') + get_column_letter(col + 1)
+        preview += '{' + label + ''.join('|' + filter_name + (':' + argument if argument else '')
+                                         for filter_name, argument in filters) + '}'
+    return preview
+
+
+def apply_filters(project, rows=None, where=(), encoding=None, delimiter=None):
+    # options of the command line are added to the filters stored in the project,
+    # the encoding and the delimiter of a csv source replace the stored ones
+    if rows:
+        project.row_from, project.row_to = parse_row_range(rows)
+    project.row_filters = list(project.row_filters) + [parse_condition(text) for text in where]
+    if encoding:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise ProjectError("Неизвестная кодировка: " + encoding)
+        project.source_encoding = encoding
+    if delimiter:
+        project.source_delimiter = parse_delimiter(delimiter)
+
+
+class RowFilter:
+    """
+    Source rows row_from..row_to (numbers as in excel, 0 means no limit) that pass
+    every condition. The range is handed to the source, conditions are checked per row.
+    """
+    def __init__(self, row_from=0, row_to=0, conditions=None):
+        self.min_row = max(int(row_from or 0), 2)
+        self.max_row = int(row_to) if row_to else None
+        if self.max_row is not None and self.max_row < self.min_row:
+            raise ProjectError("Неверный диапазон строк: " + str(row_from) + "-" + str(row_to))
+        self.tests = [compile_condition(condition) for condition in conditions or []]
+        self.active = self.min_row > 2 or self.max_row is not None or bool(self.tests)
+
+    def match(self, row) -> bool:
+        for test in self.tests:
+            if not test(row):
+                return False
+        return True
+
+
+def parse_reference(text):
+    # "B" is a column of the source, "clients:B" a column of the lookup table "clients"
+    name, _, letter = str(text).rpartition(':')
+    try:
+        return name.strip() or None, column_index_from_string(letter.strip().upper()) - 1
+    except ValueError:
+        raise ProjectError("Неверный столбец: " + str(text))
+
+
+def lookup_key(value):
+    # 105, 105.0 and "105 " find each other, as the same id is often a number in one table and text in another
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    key = '' if value is None else cell_to_str(value).strip()
+    return key if key != '' else None
+
+
+class Lookup:
+    """
+    A reference table, like the one of VLOOKUP: the row whose key column equals the
+    match column of the source row. The table is read once into a dict, so every
+    source row finds its match in O(1). With repeated keys the first row wins.
+    """
+    def __init__(self, name, path, key, match, sheet='', encoding='', delimiter=''):
+        self.name = name
+        self.path = path
+        self.sheet = sheet
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.key_col = parse_reference(key)[1]
+        self.match_col = parse_reference(match)[1]
+        self.index = None
+
+    @classmethod
+    def from_dict(cls, spec: dict, source_file=''):
+        try:
+            # without a file the table is another sheet of the source
+            return cls(str(spec['name']), spec.get('file') or source_file, spec['key'], spec['match'],
+                       spec.get('sheet', ''), spec.get('encoding', ''), spec.get('delimiter', ''))
+        except (KeyError, TypeError, AttributeError):
+            raise ProjectError("Неверная таблица подстановки: " + str(spec))
+
+    def load(self, cache_dir=None):
+        try:
+            source = open_source(resolve_source(self.path), self.encoding, self.delimiter, cache_dir, self.sheet)
+            index = {}
+            for row in source.iter_rows(min_row=2):
+                key = lookup_key(row[self.key_col] if self.key_col < len(row) else None)
+                if key is not None and key not in index:
+                    index[key] = row
+        except KeyError:
+            raise ProjectError("В файле " + str(self.path) + " нет листа " + str(self.sheet))
+        except (UnicodeError, LookupError) as e:
+            raise ProjectError("Не удалось прочитать таблицу подстановки " + self.name + ": " + str(e))
+        self.index = index
+
+    def find(self, row):
+        value = row[self.match_col] if self.match_col < len(row) else None
+        return self.index.get(lookup_key(value))
+
+
+class RowJoin:
+    """
+    The source row followed by the matching row of every lookup table, as one flat row.
+    Rows without a match get empty columns, so their cells keep the fallback.
+    """
+    def __init__(self, width, tables):
+        self.width = width
+        # (Lookup, number of its columns in the joined row)
+        self.tables = tables
+
+    def __call__(self, row):
+        joined = list(row[:self.width])
+        joined += [None] * (self.width - len(joined))
+        for lookup, width in self.tables:
+            found = lookup.find(row)
+            if found is None:
+                joined += [None] * width
+            else:
+                joined += found[:width]
+                joined += [None] * (width - min(len(found), width))
+        return joined
+
+
+def folder_name(value) -> str:
+    name = replace_illegible_chars(cell_to_str(value), ILLEGIBLE_CHARS).replace('\n', ' ').strip(' .')
+    return name if value is not None and name != '' else '_'
+
+
+class Sharding:
+    """
+    Puts the files into subfolders of the output folder: "column:D" by the value of
+    a column ("column:D/E" nests one folder per column), "hash:4" by the leading hex
+    digits of the file name hash, two per folder, or "count:1000" by consecutive
+    source rows, that many per folder. An empty spec keeps every file in one folder.
+    """
+    def __init__(self, spec=''):
+        self.spec = str(spec or '').strip()
+        self.mode = None
+        self.columns = []
+        self.size = 0
+        if self.spec == '':
+            return
+
+        mode, _, value = self.spec.partition(':')
+        self.mode = mode.strip().lower()
+        value = value.strip()
+        if self.mode not in SHARD_MODES:
+            raise ProjectError("Неизвестный способ разбиения на папки: " + self.spec)
+        try:
+            if self.mode == 'column':
+                self.columns = [column_index_from_string(letter.strip().upper()) - 1 for letter in value.split('/')]
+            else:
+                self.size = int(value)
+        except ValueError:
+            raise ProjectError("Неверное разбиение на папки: " + self.spec)
+        if self.mode == 'hash' and not 1 <= self.size <= 8 or self.mode == 'count' and self.size < 1:
+            raise ProjectError("Неверное разбиение на папки: " + self.spec)
+
+    @property
+    def active(self) -> bool:
+        return self.mode is not None
+
+    def folder(self, i, row, filename) -> str:
+        if self.mode == 'column':
+            return '/'.join(folder_name(row[col] if col < len(row) else None) for col in self.columns)
+        if self.mode == 'hash':
+            # by name, so rows with the same name still end up in the same file
+            digest = hashlib.sha1(filename.encode('utf-8', 'surrogatepass')).hexdigest()[:self.size]
+            return '/'.join(digest[k:k + 2] for k in range(0, self.size, 2))
+        return str(i // self.size).zfill(4)
+
+    def path(self, i, row, filename) -> str:
+        # names in the manifest and the index are relative to the output folder, always with "/"
+        if self.mode is None:
+            return filename
+        return self.folder(i, row, filename) + '/' + filename
+
+
+def fallback_name(i, filename) -> str:
+    folder, _, _ = filename.rpartition('/')
+    return folder + '/' + str(i) if folder else str(i)
+
+
+def zip_stamp(path):
+    # zip can not store dates before 1980
+    return max(time.localtime(os.path.getmtime(path))[:6], (1980, 1, 1, 0, 0, 0))
+
+
+class StampedZipFile(ZipFile):
+    # every member gets the same date, so equal workbooks are saved as equal bytes
+    def __init__(self, file, date_time):
+        super(StampedZipFile, self).__init__(file, 'w', ZIP_DEFLATED, allowZip64=True)
+        self.date_time = date_time
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        if not isinstance(zinfo_or_arcname, ZipInfo):
+            zinfo_or_arcname = ZipInfo(zinfo_or_arcname, self.date_time)
+            zinfo_or_arcname.compress_type = self.compression
+            zinfo_or_arcname.external_attr = 0o600 << 16
+        super(StampedZipFile, self).writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        with open(filename, 'rb') as f:
+            self.writestr(arcname or filename, f.read(), compress_type, compresslevel)
+
+
+def save_workbook(wb, filename, date_time):
+    ExcelWriter(wb, StampedZipFile(filename, date_time)).save()
+
+
+class Project:
+    def __init__(self, source_file='', pattern_file='', default_values=None, relations=None,
+                 relations_many=None, name_col_index=0, add_name='', check_name=True,
+                 source_encoding='', source_delimiter='', row_from=0, row_to=0, row_filters=None, shard='',
+                 group_by='', repeat_rows=None, lookups=None, expressions=None):
+        self.source_file = source_file
+        self.pattern_file = pattern_file
+        self.default_values = default_values if default_values is not None else {}
+        self.relations = relations if relations is not None else {}
+        self.relations_many = relations_many if relations_many is not None else {}
+        self.name_col_index = name_col_index
+        self.add_name = add_name
+        self.check_name = check_name
+        # only used by csv sources, empty means utf-8 and a guessed delimiter
+        self.source_encoding = source_encoding
+        self.source_delimiter = source_delimiter
+        # a subset of the source rows, see RowFilter
+        self.row_from = row_from
+        self.row_to = row_to
+        self.row_filters = row_filters if row_filters is not None else []
+        # subfolders of the output folder, see Sharding
+        self.shard = shard
+        # one file per distinct value of the group_by column, repeat_rows maps a sheet
+        # to the template rows ("5-7") repeated for every row of the group
+        self.group_by = group_by
+        self.repeat_rows = repeat_rows if repeat_rows is not None else {}
+        # reference tables for "name:B" mappings, see Lookup
+        self.lookups = lookups if lookups is not None else []
+        # cells filled by an expression such as "{B} {C|upper}", see parse_expression
+        self.expressions = expressions if expressions is not None else {}
+
+    @classmethod
+    def from_dict(cls, save: dict):
+        missing = [key for key in SAVE_KEYS if key not in save]
+        if missing:
+            raise ProjectError("Неподходящее сохранение")
+
+        return cls(source_file=save['source_file'],
+                   pattern_file=save['pattern_file'],
+                   default_values=save['default_values'],
+                   relations=save['excels_connection'],
+                   relations_many=save['excels_relation_many'],
+                   name_col_index=int(save['col_index_name']),
+                   add_name=save['add_name'],
+                   check_name=save['check_name'] == "True",
+                   source_encoding=save.get('source_encoding', ''),
+                   source_delimiter=save.get('source_delimiter', ''),
+                   row_from=int(save.get('row_from', 0) or 0),
+                   row_to=int(save.get('row_to', 0) or 0),
+                   row_filters=save.get('row_filters', []),
+                   shard=save.get('shard', ''),
+                   group_by=save.get('group_by', ''),
+                   repeat_rows=save.get('repeat_rows', {}),
+                   lookups=save.get('lookups', []),
+                   expressions=save.get('expressions', {}))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            try:
+                save = json.load(f)
+            except ValueError:
+                raise ProjectError("Неподходящее сохранение")
+        if not isinstance(save, dict):
+            raise ProjectError("Неподходящее сохранение")
+        return cls.from_dict(save)
+
+    def to_dict(self) -> dict:
+        return {
+            'source_file' : self.source_file,
+            'pattern_file' : self.pattern_file,
+            'default_values' : self.default_values,
+            'excels_connection' : self.relations,
+            'excels_relation_many' : self.relations_many,
+            'col_index_name' : str(self.name_col_index),
+            'add_name' : str(self.add_name),
+            'check_name' : str(self.check_name),
+            'source_encoding' : self.source_encoding,
+            'source_delimiter' : self.source_delimiter,
+            'row_from' : self.row_from,
+            'row_to' : self.row_to,
+            'row_filters' : self.row_filters,
+            'shard' : self.shard,
+            'group_by' : self.group_by,
+            'repeat_rows' : self.repeat_rows,
+            'lookups' : self.lookups,
+            'expressions' : self.expressions
+            }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=4)
+
+
+class MappingPlan:
+    """
+    Every mapped cell is a slot. evaluate() returns one value per slot, None means
+    the slot keeps its fallback: the default value or the original template value.
+    """
+    def __init__(self, project: Project, pattern_wb, originals=None, lookups=None):
+        self.cells = []
+        self.fallbacks = []
+        self.relations = []
+        self.relations_many = []
+        self.expressions = []
+        self.lookups = []
+        self.join = None
+
+        for sheet in pattern_wb:
+            default_dict = project.default_values.get(sheet.title, {})
+            sheet_dict = project.relations.get(sheet.title, {})
+            sheet_many_dict = project.relations_many.get(sheet.title, {})
+            sheet_expressions = project.expressions.get(sheet.title, {})
+            if not default_dict and not sheet_dict and not sheet_many_dict and not sheet_expressions:
+                continue
+
+            # defaults never change between rows, so they are written once here
+            for key, value in default_dict.items():
+                if key not in sheet_dict and key not in sheet_many_dict and key not in sheet_expressions:
+                    sheet[key] = value
+
+            for key, letter in sheet_dict.items():
+                if key in sheet_many_dict or key in sheet_expressions:
+                    continue
+                if key in default_dict:
+                    fallback = default_dict[key]
+                elif originals is not None and key in originals.get(sheet.title, {}):
+                    fallback = originals[sheet.title][key]
+                else:
+                    fallback = sheet[key].value
+                self.relations.append((self.add_slot(sheet[key], fallback), parse_reference(letter)))
+
+            for key, comb_dict in sheet_many_dict.items():
+                if key in sheet_expressions:
+                    continue
+                cols = tuple(parse_reference(item) for item in comb_dict['items'])
+                self.relations_many.append((self.add_slot(sheet[key], ''), cols, comb_dict['delimeter']))
+
+            for key, text in sheet_expressions.items():
+                self.expressions.append((self.add_slot(sheet[key], ''), parse_expression(str(text))))
+
+        self.place_columns(lookups or {})
+
+    def place_columns(self, lookups):
+        # columns of lookup tables follow the source columns in the joined row
+        references = [reference for slot, reference in self.relations]
+        references += [reference for slot, cols, delimiter in self.relations_many for reference in cols]
+        references += [part[0] for slot, parts in self.expressions for part in parts if not isinstance(part, str)]
+        names = []
+        for name, col in references:
+            if name is not None and name not in names:
+                if name not in lookups:
+                    raise ProjectError("Неизвестная таблица подстановки: " + name)
+                names.append(name)
+
+        offsets = {None : 0}
+        if names:
+            self.lookups = [lookups[name] for name in names]
+            width = max([col for name, col in references if name is None] +
+                        [lookup.match_col for lookup in self.lookups]) + 1
+            tables = []
+            for lookup in self.lookups:
+                offsets[lookup.name] = width + sum(table_width for _, table_width in tables)
+                tables.append((lookup, max(col for name, col in references if name == lookup.name) + 1))
+            self.join = RowJoin(width, tables)
+
+        self.relations = [(slot, offsets[name] + col) for slot, (name, col) in self.relations]
+        self.relations_many = [(slot, tuple(offsets[name] + col for name, col in cols), delimiter)
+                               for slot, cols, delimiter in self.relations_many]
+        self.expressions = [(slot, compile_expression(parts, lambda reference: offsets[reference[0]] + reference[1]))
+                            for slot, parts in self.expressions]
+
+    def add_slot(self, cell, fallback):
+        self.cells.append(cell)
+        self.fallbacks.append(fallback)
+        return len(self.cells) - 1
+
+    def evaluate(self, row) -> list:
+        if self.join is not None:
+            row = self.join(row)
+        width = len(row)
+        values = [None] * len(self.cells)
+
+        for slot, col in self.relations:
+            value = row[col] if col < width else None
+            if value is not None and value != '':
+                values[slot] = cell_to_str(value)
+
+        for slot, cols, delimiter in self.relations_many:
+            joined = []
+            for col in cols:
+                value = row[col] if col < width else None
+                if value is not None and value != '':
+                    joined.append(cell_to_str(value))
+            values[slot] = delimiter.join(joined)
+
+        for slot, expression in self.expressions:
+            values[slot] = expression(row)
+        return values
+
+    def fill(self, values):
+        for cell, fallback, value in zip(self.cells, self.fallbacks, values):
+            cell.value = fallback if value is None else value
+
+
+class OpenpyxlWriter:
+    name = 'openpyxl'
+
+    def __init__(self, plan: MappingPlan, pattern_wb, stamp):
+        self.plan = plan
+        self.pattern_wb = pattern_wb
+        self.stamp = stamp
+
+    def render(self, values) -> bytes:
+        self.plan.fill(values)
+        data = BytesIO()
+        save_workbook(self.pattern_wb, data, self.stamp)
+        return data.getvalue()
+
+    def write(self, values, path):
+        self.plan.fill(values)
+        save_workbook(self.pattern_wb, path, self.stamp)
+
+
+class XmlPatchWriter:
+    name = 'xml'
+
+    def __init__(self, plan: MappingPlan, pattern_wb, stamp):
+        plan.fill([None] * len(plan.cells))
+        data = BytesIO()
+        save_workbook(pattern_wb, data, stamp)
+        # sheet paths are assigned while saving
+        slots = [(cell.parent.path[1:], cell.coordinate) for cell in plan.cells]
+        self.template = PatchTemplate(data.getvalue(), slots, stamp)
+
+    def render(self, values) -> bytes:
+        return self.template.render(values)
+
+    def write(self, values, path):
+        data = self.template.render(values)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+class GroupWriter:
+    """
+    One file for a group of source rows. Mapped cells outside the repeated rows take
+    the first row of the group, the repeated rows are filled once for every row.
+    Rows are inserted, which only the openpyxl workbook can do.
+    """
+    name = 'openpyxl'
+
+    def __init__(self, plan: MappingPlan, pattern_wb, stamp, repeat_rows):
+        self.plan = plan
+        self.pattern_wb = pattern_wb
+        self.stamp = stamp
+        self.expansions = []
+        for title, text in repeat_rows.items():
+            if title not in pattern_wb.sheetnames:
+                raise ProjectError("В шаблоне нет листа для повторяемых строк: " + title)
+            top, bottom = parse_row_range(str(text))
+            if top == 0 or bottom == 0:
+                raise ProjectError("Неверный диапазон повторяемых строк: " + str(text))
+            sheet = pattern_wb[title]
+            slots = [(slot, (cell.row, cell.column)) for slot, cell in enumerate(plan.cells)
+                     if cell.parent is sheet and top <= cell.row <= bottom]
+            self.expansions.append((RowExpansion(sheet, top, bottom), slots))
+
+    def render(self, values) -> bytes:
+        # values of every row of the group
+        self.plan.fill(values[0])
+        fallbacks = self.plan.fallbacks
+        data = BytesIO()
+        try:
+            for expansion, slots in self.expansions:
+                expansion.apply([{position : fallbacks[slot] if row_values[slot] is None else row_values[slot]
+                                  for slot, position in slots} for row_values in values])
+            save_workbook(self.pattern_wb, data, self.stamp)
+        finally:
+            for expansion, slots in self.expansions:
+                expansion.restore()
+        return data.getvalue()
+
+
+WRITERS = {
+    'openpyxl' : OpenpyxlWriter,
+    'xml' : XmlPatchWriter
+    }
+
+
+class Divider:
+    def __init__(self, project: Project, output_dir='files', source=None, pattern_wb=None, originals=None,
+                 workers=1, writer='xml', incremental=False, report=False, profile=None, threads=WRITE_THREADS,
+                 source_cache=SOURCE_CACHE_DIR, index=False, archive=None, archive_files=0, archive_bytes=0,
+                 dedup=None):
+        self.project = project
+        self.output_dir = Path(output_dir)
+        self.source = source
+        self.pattern_wb = pattern_wb
+        # original values of mapped cells when pattern_wb has been changed, like the one shown in the window
+        self.originals = originals
+        self.workers = max(int(workers), 1)
+        if writer not in WRITERS:
+            raise ProjectError("Неизвестный способ записи файлов: " + str(writer))
+        self.writer_name = writer
+        # the writers the files were actually written with, from this process and the workers
+        self.writers_used = set()
+        # files are written to disk by these threads while the next rows are filled, 0 writes in place
+        self.threads = max(int(threads), 0)
+        self.rows = RowFilter()
+        self.shards = Sharding()
+        self.group_col = None
+        self.groups = None
+        self.group_rows = {}
+        # row to file list next to the output folder, always written for sharded output
+        self.write_index = index
+        self.index = None
+        self.folders = set()
+        # one zip archive instead of the output folder, split into volumes by files or bytes
+        self.archive = archive
+        self.archive_files = max(int(archive_files), 0)
+        self.archive_bytes = max(int(archive_bytes), 0)
+        self.zip = None
+        # rows with the same values as an earlier row get a hard link ('link') or a copy ('copy') of its file
+        if dedup not in DEDUP_MODES:
+            raise ProjectError("Неизвестный способ повторного использования файлов: " + str(dedup))
+        if dedup is not None and archive is not None:
+            raise ProjectError("В архиве одинаковые файлы не связываются, уберите один из ключей")
+        self.dedup = dedup
+        self.contents = {}
+        self.content_paths = {}
+        # folder of parsed sources, None reads the source file every time
+        self.source_cache = source_cache
+        self.filtered = 0
+        self.files = None
+        # only rows whose mapped values changed since the last run are written
+        self.incremental = incremental
+        if incremental and archive is not None:
+            raise ProjectError("Архив каждый раз создаётся заново, создавать только изменившиеся файлы в нём нельзя")
+        if profile is not None and profile not in PROFILERS:
+            raise ProjectError("Неизвестный способ профилирования: " + str(profile))
+        self.report = report or profile is not None
+        self.profiler = Profiler(profile)
+        self.timer = PhaseTimer()
+        self.stamp = None
+        self.plan = None
+        self.writer = None
+        self.manifest = None
+        self.seen_names = set()
+        self.written = 0
+        self.linked = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.cancelled = False
+
+    def load(self):
+        if self.source is None:
+            self.load_source()
+        if self.pattern_wb is None and self.workers == 1 and self.writer is None:
+            self.load_pattern()
+        if self.stamp is None:
+            self.stamp = zip_stamp(resolve_file(self.project.pattern_file))
+
+    def load_source(self):
+        start = time.perf_counter()
+        try:
+            self.source = open_source(resolve_source(self.project.source_file),
+                                      self.project.source_encoding, self.project.source_delimiter, self.source_cache)
+        except (UnicodeError, LookupError) as e:
+            raise ProjectError("Не удалось прочитать источник в кодировке " +
+                               (self.project.source_encoding or 'utf-8') + ": " + str(e))
+        self.timer.add('load_source', time.perf_counter() - start)
+
+    def load_pattern(self):
+        start = time.perf_counter()
+        self.pattern_wb = load_workbook(resolve_file(self.project.pattern_file))
+        self.originals = None
+        self.timer.add('load_pattern', time.perf_counter() - start)
+
+    def validate(self):
+        if self.project.source_file == '' or self.project.pattern_file == '':
+            raise ProjectError("Для начала работы нужно чтобы поля источник информации и шаблон были заполнены")
+        if self.project.name_col_index == 0 and not self.project.check_name:
+            raise ProjectError('Нужно выбрать поле "Использовать столбец как новые имена"')
+        if not isinstance(self.project.row_filters, list):
+            raise ProjectError("Условия отбора строк должны быть списком")
+        self.rows = RowFilter(self.project.row_from, self.project.row_to, self.project.row_filters)
+        self.shards = Sharding(self.project.shard)
+        self.group_col = None
+        if self.project.group_by:
+            try:
+                self.group_col = column_index_from_string(str(self.project.group_by).upper()) - 1
+            except ValueError:
+                raise ProjectError("Неверный столбец группировки: " + str(self.project.group_by))
+            if not isinstance(self.project.repeat_rows, dict):
+                raise ProjectError("Повторяемые строки шаблона должны быть заданы по листам")
+
+    def row_count(self) -> int:
+        if self.group_col is not None:
+            return len(self.group_index())
+        last = self.source.row_count() + 1
+        if self.rows.max_row is not None:
+            last = min(last, self.rows.max_row)
+        return max(last - self.rows.min_row + 1, 0)
+
+    def compile_plan(self):
+        start = time.perf_counter()
+        if not isinstance(self.project.lookups, list):
+            raise ProjectError("Таблицы подстановки должны быть списком")
+        lookups = {}
+        for spec in self.project.lookups:
+            lookup = Lookup.from_dict(spec, self.project.source_file)
+            lookups[lookup.name] = lookup
+        self.plan = MappingPlan(self.project, self.pattern_wb, self.originals, lookups)
+        loaded = time.perf_counter()
+        for lookup in self.plan.lookups:
+            lookup.load(self.source_cache)
+        self.timer.add('lookups', time.perf_counter() - loaded)
+        if self.project.group_by:
+            self.writer = GroupWriter(self.plan, self.pattern_wb, self.stamp, self.project.repeat_rows)
+        else:
+            try:
+                self.writer = WRITERS[self.writer_name](self.plan, self.pattern_wb, self.stamp)
+            except ValueError:
+                # the patcher could not make sense of the template xml
+                self.writer = OpenpyxlWriter(self.plan, self.pattern_wb, self.stamp)
+        self.writers_used.add(self.writer.name)
+        self.timer.add('compile', time.perf_counter() - start)
+
+    def writer_used(self) -> str:
+        return ', '.join(sorted(self.writers_used)) or self.writer_name
+
+    def make_filename(self, i, row) -> str:
+        filename = ''
+        if self.project.name_col_index != 0:
+            column_index = self.project.name_col_index - 1
+            value = row[column_index] if len(row) > column_index else None
+            filename += replace_illegible_chars(str(value), ILLEGIBLE_CHARS)
+
+        if self.project.check_name or filename.replace(' ', '') == '':
+            filename += str(i)
+        if str(self.project.add_name) != '':
+            filename += str(self.project.add_name)
+        return filename.replace('\n', ' ')
+
+    def divide_row(self, i, row, filename, previous_key) -> list:
+        """
+        Hands the row over to the writer pool and returns the rows whose files are
+        finished by now, in order, as (i, filename, key, action), the action is
+        'write', 'link' (the same content was written before) or 'skip'.
+        """
+        timer = self.timer
+        start = time.perf_counter()
+        if self.project.group_by:
+            values = [self.plan.evaluate(member) for member in row]
+        else:
+            values = self.plan.evaluate(row)
+        filled = time.perf_counter()
+        key = values_key(values)
+        hashed = time.perf_counter()
+        timer.add('fill', filled - start)
+        timer.add('hash', hashed - filled)
+
+        path = str(self.output_dir / (filename + '.xlsx'))
+        fallback = str(self.output_dir / (fallback_name(i, filename) + '.xlsx'))
+        if previous_key == key and os.path.isfile(path):
+            self.remember(key, path, fallback, keep=True)
+            return self.completed(self.files.skip((i, filename, key, 'skip', hashed - start)))
+
+        folder = filename.rpartition('/')[0]
+        if folder and folder not in self.folders and self.archive is None:
+            (self.output_dir / folder).mkdir(parents=True, exist_ok=True)
+            self.folders.add(folder)
+
+        source = self.contents.get(key) if self.dedup is not None else None
+        if source is not None:
+            self.remember(key, path, fallback, keep=True)
+            tag = (i, filename, key, 'link', hashed - start)
+            return self.completed(self.files.link(path, fallback, source, tag, copy=self.dedup == 'copy'))
+
+        data = self.writer.render(values)
+        rendered = time.perf_counter()
+        timer.add('render', rendered - hashed)
+        self.remember(key, path, fallback)
+        tag = (i, filename, key, 'write', rendered - start)
+        return self.completed(self.files.submit(path, fallback, data, tag))
+
+    def remember(self, key, path, fallback, keep=False):
+        # the file of every distinct content, later rows with the same values link to it
+        if self.dedup is None:
+            return
+        previous = self.content_paths.get(path)
+        if previous is not None and previous != key and self.contents.get(previous, (None,))[0] == path:
+            # the file is replaced by other content
+            del self.contents[previous]
+        self.content_paths[path] = key
+        if keep:
+            self.contents.setdefault(key, (path, fallback))
+        else:
+            self.contents[key] = (path, fallback)
+
+    def completed(self, done) -> list:
+        results = []
+        for (i, filename, key, action, seconds), fell_back, write_seconds, waited in done:
+            if fell_back:
+                filename = fallback_name(i, filename)
+            if action != 'skip':
+                self.timer.add(action, write_seconds)
+                self.timer.add('wait', waited)
+            self.timer.add_row(seconds + write_seconds, i, filename)
+            results.append((i, filename, key, action))
+        return results
+
+    def divide_chunk(self, chunk):
+        results = []
+        for item in chunk:
+            results += self.divide_row(*item)
+        results += self.completed(self.files.flush())
+        handed = self.files.take() if isinstance(self.files, HandOver) else []
+        return results, self.timer.take(), handed, self.writer.name
+
+    def config_key(self) -> str:
+        config = self.project.to_dict()
+        # the data itself is compared row by row, and a subset of rows does not change any file
+        for key in ('source_file', 'row_from', 'row_to', 'row_filters'):
+            del config[key]
+        stat = os.stat(resolve_file(self.project.pattern_file))
+        return config_key({'project' : config, 'pattern' : [stat.st_size, stat.st_mtime]})
+
+    def iter_rows(self):
+        rows = self.source.iter_rows(min_row=self.rows.min_row, max_row=self.rows.max_row)
+        # numbering follows the source, so a subset gets the same names as a full run
+        i = self.rows.min_row - 3
+        while True:
+            start = time.perf_counter()
+            row = next(rows, None)
+            read = time.perf_counter()
+            if row is None:
+                break
+            i += 1
+            if self.rows.tests and not self.rows.match(row):
+                self.filtered += 1
+                self.timer.add('filter', time.perf_counter() - start)
+                continue
+            self.timer.add('read', read - start)
+            yield i, row
+
+    def group_index(self) -> list:
+        """
+        Groups in the order they first appear, as (i of the first row, rows).
+        Built in one pass over the source, rows of a group keep the source order.
+        """
+        if self.groups is None:
+            groups = {}
+            for i, row in self.iter_rows():
+                start = time.perf_counter()
+                value = row[self.group_col] if self.group_col < len(row) else None
+                key = '' if value is None else cell_to_str(value)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = (i, [], [])
+                group[1].append(row)
+                group[2].append(i)
+                self.timer.add('group', time.perf_counter() - start)
+            self.groups = [(i, rows) for i, rows, members in groups.values()]
+            self.group_rows = {i : members for i, rows, members in groups.values()}
+        return self.groups
+
+    def iter_items(self):
+        items = self.iter_rows() if self.group_col is None else self.group_index()
+        for i, row in items:
+            start = time.perf_counter()
+            first = row if self.group_col is None else row[0]
+            filename = self.shards.path(i, first, self.make_filename(i, first))
+            self.timer.add('filename', time.perf_counter() - start)
+            previous_key = None
+            # a name used twice in one run is always written, the last row has to win
+            if self.incremental and filename not in self.seen_names:
+                previous_key = self.manifest.previous_key(filename)
+            self.seen_names.add(filename)
+            yield i, row, filename, previous_key
+
+    def iter_chunks(self):
+        chunk = []
+        for item in self.iter_items():
+            chunk.append(item)
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def record(self, i, filename, key, action):
+        if self.manifest is not None:
+            self.manifest.add(filename, key)
+        if self.index is not None:
+            for member in self.group_rows.get(i, (i,)):
+                self.index.add(member + 2, filename + '.xlsx')
+        if action == 'link':
+            self.linked += 1
+        if action != 'skip':
+            self.written += 1
+        else:
+            self.skipped += 1
+
+    def finish(self):
+        # files of rows outside a subset are neither stale nor forgotten
+        complete = not self.cancelled and not self.rows.active
+        if self.incremental and complete:
+            for filename in self.manifest.stale():
+                path = self.output_dir / (filename + '.xlsx')
+                if path.is_file():
+                    path.unlink()
+                    self.deleted += 1
+                    remove_empty_folders(path.parent, self.output_dir)
+        if self.manifest is not None:
+            self.manifest.save(complete=complete)
+
+    def cancel(self):
+        # checked between files, so the file being written is always finished
+        self.cancelled = True
+
+    def run(self, progress=None):
+        self.cancelled = False
+        self.validate()
+        self.timer = PhaseTimer()
+        self.profiler.start()
+        start = time.perf_counter()
+        try:
+            count = self.generate(progress)
+        except BaseException:
+            self.profiler.abort()
+            raise
+
+        total = time.perf_counter() - start
+        profile = self.profiler.stop(self.output_dir)
+        if self.report:
+            self.write_report(count, total, profile)
+        return count
+
+    def generate(self, progress=None) -> int:
+        self.load()
+        self.manifest = None
+        if self.archive is None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.manifest = Manifest(manifest_path(self.output_dir), self.config_key())
+        self.seen_names = set()
+        self.folders = set()
+        self.contents = {}
+        self.content_paths = {}
+        self.groups = None
+        self.group_rows = {}
+        self.written = self.skipped = self.deleted = self.filtered = self.linked = 0
+        if self.write_index or self.shards.active:
+            self.index = RowIndex(index_path(self.output_dir))
+
+        try:
+            self.files = self.open_files()
+            try:
+                if self.workers > 1:
+                    count = self.run_parallel(progress)
+                else:
+                    count = self.run_serial(progress)
+            finally:
+                if self.files is not None:
+                    self.files.close()
+                    self.files = None
+        except BaseException:
+            if self.index is not None:
+                self.index.abort()
+                self.index = None
+            if self.zip is not None:
+                self.zip.abort()
+                self.zip = None
+            raise
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+        self.finish()
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        return count
+
+    def open_files(self):
+        if self.archive is not None:
+            # the archive is written by one thread, in the order the rows come
+            self.zip = ZipArchive(self.archive, self.output_dir, self.stamp, self.archive_files, self.archive_bytes)
+            return WriterPool(min(self.threads, 1), write=self.zip.write)
+        if self.workers > 1:
+            # every worker process writes its own files
+            return None
+        return WriterPool(self.threads)
+
+    def write_report(self, count, total, profile):
+        write_report(report_path(self.output_dir, '.report.json'), {
+            'project' : self.project.to_dict(),
+            'output' : str(self.output_dir.resolve()),
+            'writer' : self.writer_used(),
+            'workers' : self.workers,
+            'rows' : count,
+            'written' : self.written,
+            'linked' : self.linked,
+            'skipped' : self.skipped,
+            'deleted' : self.deleted,
+            'filtered' : self.filtered,
+            'cancelled' : self.cancelled,
+            'total_s' : total,
+            'rows_per_s' : count / total if total > 0 else None,
+            'phases' : self.timer.summary(),
+            'slowest_rows' : self.timer.slowest_rows(),
+            'profile' : profile
+            })
+
+    def run_serial(self, progress=None):
+        # a batch compiles the writer beforehand, while the template is shared
+        if self.writer is None:
+            self.compile_plan()
+
+        total = self.row_count()
+        count = 0
+
+        def collect(results):
+            nonlocal count
+            for i, filename, key, action in results:
+                self.record(i, filename, key, action)
+                count += 1
+                if progress is not None:
+                    progress(count, total, filename)
+
+        for item in self.iter_items():
+            collect(self.divide_row(*item))
+            if self.cancelled:
+                break
+        # files already handed to the pool are finished even when cancelled
+        collect(self.completed(self.files.flush()))
+        return count
+
+    def run_parallel(self, progress=None):
+        total = self.row_count()
+        count = 0
+        pending = set()
+        # the last row with a given name must win, as it does when files are saved one by one
+        owners = {}
+        # only pending chunks are numbered, a finished one holds the bytes of its files
+        numbers = {}
+        # names of the rows of each pending chunk, to forget its owners once it is collected
+        names = {}
+        submitted = 0
+
+        def record(results):
+            nonlocal count
+            for i, filename, key, action in results:
+                self.record(i, filename, key, action)
+            count += len(results)
+            if progress is not None and results:
+                progress(count, total, results[-1][1])
+
+        def collect(done):
+            for future in done:
+                pending.discard(future)
+                del numbers[future]
+                for filename in names.pop(future):
+                    if owners.get(filename) is future:
+                        del owners[filename]
+                results, timings, handed, writer = future.result()
+                self.timer.merge(timings)
+                self.writers_used.add(writer)
+                # the bytes of a file are dropped as soon as it is queued for the archive
+                handed.reverse()
+                while handed:
+                    path, fallback, data, tag = handed.pop()
+                    results += self.completed(self.files.submit(path, fallback, data, tag))
+                record(results)
+
+        def finished(futures):
+            if self.zip is None:
+                return wait(futures, return_when=FIRST_COMPLETED)[0]
+            # the archive gets the files in the order of the rows, the same as from a single process
+            oldest = min(futures, key=numbers.get)
+            return wait([oldest])[0]
+
+        initargs = (self.project.to_dict(), str(self.output_dir), self.stamp, self.writer_name, self.threads,
+                    self.archive, self.dedup, self.source_cache)
+        with ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=initargs) as executor:
+            for chunk in self.iter_chunks():
+                earlier = {owners[item[2]] for item in chunk if item[2] in owners} & pending
+                if earlier and self.zip is None:
+                    collect(wait(earlier)[0])
+                while len(pending) >= self.workers * 2:
+                    collect(finished(pending))
+                if self.cancelled:
+                    break
+
+                future = executor.submit(divide_chunk, chunk)
+                pending.add(future)
+                numbers[future] = submitted
+                submitted += 1
+                names[future] = [item[2] for item in chunk]
+                for item in chunk:
+                    owners[item[2]] = future
+
+            if self.cancelled:
+                for future in pending:
+                    future.cancel()
+                pending = {future for future in pending if not future.cancelled()}
+            while pending:
+                collect(finished(pending))
+        if self.files is not None:
+            record(self.completed(self.files.flush()))
+        return count
+
+
+def remove_empty_folders(folder, output_dir):
+    # shard folders left without files after stale files are deleted
+    while folder != output_dir and output_dir in folder.parents:
+        try:
+            folder.rmdir()
+        except OSError:
+            return
+        folder = folder.parent
+
+
+_worker_divider = None
+
+def init_worker(project_dict, output_dir, stamp, writer, threads, archive, dedup, source_cache):
+    global _worker_divider
+    # with several processes each one finds repeated contents among its own rows
+    _worker_divider = Divider(Project.from_dict(project_dict), output_dir, writer=writer, threads=threads,
+                              archive=archive, dedup=dedup, source_cache=source_cache)
+    _worker_divider.stamp = stamp
+    _worker_divider.files = WriterPool(threads) if archive is None else HandOver()
+    _worker_divider.load_pattern()
+    _worker_divider.compile_plan()
+
+
+def divide_chunk(chunk):
+    return _worker_divider.divide_chunk(chunk)
+
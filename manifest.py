@@ -0,0 +1,121 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import csv
+import json
+import hashlib
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(output_dir) -> Path:
+    # next to the output folder, so it is never mistaken for one of the generated files
+    output_dir = Path(output_dir)
+    return output_dir.parent / (output_dir.name + '.manifest.json')
+
+
+def index_path(output_dir) -> Path:
+    output_dir = Path(output_dir)
+    return output_dir.parent / (output_dir.name + '.index.csv')
+
+
+def config_key(config: dict) -> str:
+    return hashlib.sha1(json.dumps(config, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def values_key(values) -> str:
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path, config: str):
+        self.path = Path(path)
+        self.config = config
+        self.files = {}
+        self.previous = {}
+        self.same_config = False
+
+        if self.path.is_file():
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            if data.get('version') == MANIFEST_VERSION:
+                self.previous = data.get('files', {})
+                # with another mapping every file has to be written again
+                self.same_config = data.get('config') == self.config
+
+    def previous_key(self, filename):
+        if not self.same_config:
+            return None
+        return self.previous.get(filename)
+
+    def add(self, filename, key):
+        self.files[filename] = key
+
+    def stale(self) -> list:
+        return [filename for filename in self.previous if filename not in self.files]
+
+    def save(self, complete=True):
+        files = self.files
+        if not complete:
+            # an interrupted run keeps what is known about the rows it did not reach,
+            # after a change of the mapping or template only their names, so they are written again
+            if self.same_config:
+                files = dict(self.previous)
+            else:
+                files = dict.fromkeys(self.previous)
+            files.update(self.files)
+
+        data = {
+            'version' : MANIFEST_VERSION,
+            'config' : self.config,
+            'files' : files
+            }
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+class RowIndex:
+    """
+    Source row number and the file written for it, relative to the output folder.
+    Written to a temporary file first, a run that fails keeps the previous index.
+    Rows come in the order their files are finished, with several processes that
+    is not always the order of the source.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.temp = self.path.with_name(self.path.name + '.tmp')
+        # utf-8 with a signature and ";" as excel expects them
+        self.file = open(self.temp, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file, delimiter=';')
+        self.writer.writerow(('row', 'file'))
+
+    def add(self, row, filename):
+        self.writer.writerow((row, filename))
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temp, self.path)
+
+    def abort(self):
+        self.file.close()
+        try:
+            self.temp.unlink()
+        except OSError:
+            pass
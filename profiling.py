@@ -0,0 +1,190 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import math
+import heapq
+import pstats
+import cProfile
+import tracemalloc
+from pathlib import Path
+
+PROFILERS = ('cprofile', 'tracemalloc')
+SLOWEST_ROWS = 20
+
+
+def report_path(output_dir, suffix) -> Path:
+    output_dir = Path(output_dir)
+    return output_dir.parent / (output_dir.name + suffix)
+
+
+# durations go into buckets growing by 2%, percentiles are as exact as that
+BUCKET_GROWTH = 1.02
+BUCKET_MIN_S = 1e-7
+
+
+def bucket_of(seconds) -> int:
+    if seconds <= BUCKET_MIN_S:
+        return 0
+    return int(math.log(seconds / BUCKET_MIN_S, BUCKET_GROWTH)) + 1
+
+
+def bucket_value(bucket) -> float:
+    if bucket == 0:
+        return BUCKET_MIN_S
+    return BUCKET_MIN_S * BUCKET_GROWTH ** (bucket - 0.5)
+
+
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = bucket_of(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, count, total, maximum, buckets):
+        self.count += count
+        self.total += total
+        self.max = max(self.max, maximum)
+        for bucket, number in buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + number
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = min(int(self.count * fraction), self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return min(bucket_value(bucket), self.max)
+        return self.max
+
+
+class PhaseTimer:
+    """
+    Durations in seconds per phase as a histogram, so the memory does not grow with the rows.
+    take() hands the collected stats over, workers send them back to the main process.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.slowest = []
+
+    def add(self, phase, seconds):
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.add(seconds)
+
+    def add_row(self, seconds, i, filename):
+        item = (seconds, i, filename)
+        if len(self.slowest) < SLOWEST_ROWS:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def take(self):
+        taken = ({phase : (stats.count, stats.total, stats.max, stats.buckets) for phase, stats in self.phases.items()},
+                 self.slowest)
+        self.phases = {}
+        self.slowest = []
+        return taken
+
+    def merge(self, taken):
+        phases, slowest = taken
+        for phase, data in phases.items():
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = PhaseStats()
+            stats.merge(*data)
+        for seconds, i, filename in slowest:
+            self.add_row(seconds, i, filename)
+
+    def summary(self) -> dict:
+        result = {}
+        for phase, stats in self.phases.items():
+            result[phase] = {
+                'count' : stats.count,
+                'total_s' : stats.total,
+                'mean_ms' : stats.total / stats.count * 1000 if stats.count else None,
+                'p50_ms' : stats.percentile(0.50) * 1000 if stats.count else None,
+                'p95_ms' : stats.percentile(0.95) * 1000 if stats.count else None,
+                'p99_ms' : stats.percentile(0.99) * 1000 if stats.count else None,
+                'max_ms' : stats.max * 1000 if stats.count else None
+                }
+        return result
+
+    def slowest_rows(self) -> list:
+        return [{'row' : i + 2, 'file' : filename, 'ms' : seconds * 1000}
+                for seconds, i, filename in sorted(self.slowest, reverse=True)]
+
+
+class Profiler:
+    def __init__(self, kind=None):
+        if kind is not None and kind not in PROFILERS:
+            raise ValueError(kind)
+        self.kind = kind
+        self.profile = None
+
+    def start(self):
+        if self.kind == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.kind == 'tracemalloc':
+            tracemalloc.start()
+
+    def abort(self):
+        # a failed or cancelled run leaves nothing behind, the process keeps running without a profiler
+        if self.kind == 'cprofile' and self.profile is not None:
+            self.profile.disable()
+            self.profile = None
+        elif self.kind == 'tracemalloc' and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stop(self, output_dir) -> dict:
+        if self.kind == 'cprofile':
+            self.profile.disable()
+            self.profile.dump_stats(str(report_path(output_dir, '.prof')))
+            text = io.StringIO()
+            pstats.Stats(self.profile, stream=text).sort_stats('cumulative').print_stats(40)
+            report_path(output_dir, '.profile.txt').write_text(text.getvalue(), encoding='utf-8')
+            return {'kind' : 'cprofile', 'stats' : str(report_path(output_dir, '.prof'))}
+
+        if self.kind == 'tracemalloc':
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top = snapshot.statistics('lineno')[:20]
+            return {
+                'kind' : 'tracemalloc',
+                'current_mb' : current / 2**20,
+                'peak_mb' : peak / 2**20,
+                'top' : [{'line' : str(stat.traceback), 'kb' : stat.size / 1024, 'count' : stat.count} for stat in top]
+                }
+        return None
+
+
+def write_report(path, report: dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,160 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+# Template rows repeated once per row of a group, the rows below move down,
+# much like inserting rows in excel.
+
+import re
+
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.worksheet.dimensions import DimensionHolder
+
+# A1 or A1:B2, not a part of a name, a function or a reference to another sheet
+REFERENCE = re.compile(r"(?<![A-Za-z0-9_.!$'])(\$?[A-Z]{1,3})(\$?)(\d+)(?::(\$?[A-Z]{1,3})(\$?)(\d+))?(?![A-Za-z0-9_(!])")
+
+
+def shift_formula(formula: str, top, bottom, extra, offset=0) -> str:
+    """
+    Row references of a formula after the rows top..bottom were repeated: rows below
+    move down by extra, a range that starts above the block and ends in it grows with
+    it, and in a copy of the block made offset rows lower relative references to the
+    block point to the rows of that copy.
+    """
+    def moved(row, absolute):
+        if row > bottom:
+            return row + extra
+        if offset and top <= row <= bottom and not absolute:
+            return row + offset
+        return row
+
+    def replace(match):
+        column, absolute, row, end_column, end_absolute, end_row = match.groups()
+        start = int(row)
+        text = column + absolute + str(moved(start, absolute))
+        if end_column is None:
+            return text
+        end = int(end_row)
+        if not offset and start <= top <= end <= bottom:
+            end += extra
+        else:
+            end = moved(end, end_absolute)
+        return text + ':' + end_column + end_absolute + str(end)
+
+    # text in quotes is not a reference
+    parts = formula.split('"')
+    for k in range(0, len(parts), 2):
+        parts[k] = REFERENCE.sub(replace, parts[k])
+    return '"'.join(parts)
+
+
+class RowExpansion:
+    """
+    apply() puts the cells, merged ranges and row heights of one file into the sheet,
+    restore() brings the template back, so one workbook serves every file.
+    """
+    def __init__(self, sheet, top, bottom):
+        self.sheet = sheet
+        self.top = top
+        self.bottom = bottom
+        self.height = bottom - top + 1
+        self.cells = None
+        self.merged_cells = None
+        self.row_dimensions = None
+
+    def copy_cell(self, cell, row, values=None, offset=0, extra=0):
+        if isinstance(cell, MergedCell):
+            copy = MergedCell(self.sheet, row, cell.column)
+            copy._style = cell._style
+            return copy
+        copy = Cell(self.sheet, row=row, column=cell.column, style_array=cell._style)
+        position = (cell.row, cell.column)
+        if values is not None and position in values:
+            # a mapped cell holds what the first row of the group put there, never copied as is
+            copy.value = values[position]
+        elif cell.data_type == 'f':
+            copy._value = shift_formula(cell._value, self.top, self.bottom, extra, offset)
+            copy.data_type = 'f'
+        else:
+            copy._value = cell._value
+            copy.data_type = cell.data_type
+        return copy
+
+    def apply(self, copies):
+        """
+        copies holds one {(row, column) : value} per copy of the block, for the mapped
+        cells inside it. The first copy stays in place.
+        """
+        sheet = self.sheet
+        self.cells = sheet._cells
+        self.merged_cells = sheet.merged_cells
+        self.row_dimensions = sheet.row_dimensions
+        top, bottom, height = self.top, self.bottom, self.height
+        extra = (len(copies) - 1) * height
+
+        cells = {}
+        for (row, column), cell in self.cells.items():
+            if row < top:
+                if cell.data_type == 'f' and extra:
+                    cell = self.copy_cell(cell, row, extra=extra)
+                cells[(row, column)] = cell
+            elif row > bottom:
+                cells[(row + extra, column)] = self.copy_cell(cell, row + extra, extra=extra)
+            else:
+                for k, values in enumerate(copies):
+                    offset = k * height
+                    cells[(row + offset, column)] = self.copy_cell(cell, row + offset, values, offset, extra)
+
+        ranges = []
+        for merged in self.merged_cells.ranges:
+            if merged.max_row < top:
+                ranges.append(CellRange(merged.coord))
+            elif merged.min_row > bottom:
+                ranges.append(CellRange(min_col=merged.min_col, min_row=merged.min_row + extra,
+                                        max_col=merged.max_col, max_row=merged.max_row + extra))
+            elif merged.min_row >= top and merged.max_row <= bottom:
+                for k in range(len(copies)):
+                    ranges.append(CellRange(min_col=merged.min_col, min_row=merged.min_row + k * height,
+                                            max_col=merged.max_col, max_row=merged.max_row + k * height))
+            else:
+                ranges.append(CellRange(min_col=merged.min_col, min_row=merged.min_row,
+                                        max_col=merged.max_col, max_row=merged.max_row + extra))
+
+        dimensions = DimensionHolder(worksheet=sheet, default_factory=sheet._add_row)
+        for index, dimension in self.row_dimensions.items():
+            if index < top:
+                dimensions[index] = dimension
+            elif index > bottom:
+                dimensions[index + extra] = self.copy_dimension(dimension, index + extra)
+            else:
+                for k in range(len(copies)):
+                    dimensions[index + k * height] = self.copy_dimension(dimension, index + k * height)
+
+        sheet._cells = cells
+        sheet.merged_cells = MultiCellRange(ranges)
+        sheet.row_dimensions = dimensions
+
+    def copy_dimension(self, dimension, index):
+        copy = dimension.__copy__()
+        copy.index = index
+        return copy
+
+    def restore(self):
+        if self.cells is None:
+            return
+        self.sheet._cells = self.cells
+        self.sheet.merged_cells = self.merged_cells
+        self.sheet.row_dimensions = self.row_dimensions
+        self.cells = self.merged_cells = self.row_dimensions = None
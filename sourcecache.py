@@ -0,0 +1,335 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+# Parsed sources kept on disk, so a source that did not change is not parsed again.
+#
+# The file holds groups of GROUP_ROWS rows. Inside a group every column is stored
+# as a type tag per row (one byte), an 8 byte slot per row (int64 or float64,
+# for strings offset << 24 | length into the column heap) and the heap itself.
+# A json footer lists the groups, the last 24 bytes point to the footer.
+# The file is read through mmap, so rows before min_row are not even touched.
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+
+SOURCE_CACHE_DIR = 'cache'
+CACHE_VERSION = 1
+GROUP_ROWS = 16384
+MAGIC = b'EXDSRC\x00\x01'
+TRAILER = struct.Struct('<QQ8s')
+
+NONE, STR, INT, FLOAT, BOOL, DATETIME, DATE, TIME, TIMEDELTA, BIGINT = range(10)
+EPOCH = datetime.datetime(1, 1, 1)
+EPOCH_DATE = datetime.date(1, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+
+def cache_file(cache_dir, path, options) -> Path:
+    name = json.dumps([str(Path(path).resolve()), list(options)], ensure_ascii=False)
+    return Path(cache_dir) / (hashlib.sha1(name.encode('utf-8')).hexdigest() + '.src')
+
+
+def cache_key(path, options) -> dict:
+    stat = os.stat(path)
+    return {
+        'version' : CACHE_VERSION,
+        'path' : str(Path(path).resolve()),
+        'size' : stat.st_size,
+        'mtime' : stat.st_mtime_ns,
+        'options' : list(options)
+        }
+
+
+def pad(f):
+    position = f.tell()
+    if position % 8:
+        f.write(b'\0' * (8 - position % 8))
+    return f.tell()
+
+
+def encode_column(rows, col):
+    count = len(rows)
+    tags = bytearray(count)
+    data = bytearray(8 * count)
+    ints = memoryview(data).cast('q')
+    floats = memoryview(data).cast('d')
+    heap = bytearray()
+
+    def add_string(k, tag, text):
+        encoded = text.encode('utf-8', 'surrogatepass')
+        tags[k] = tag
+        ints[k] = (len(heap) << 24) | len(encoded)
+        heap.extend(encoded)
+
+    for k, row in enumerate(rows):
+        value = row[col] if col < len(row) else None
+        if value is None:
+            continue
+        if isinstance(value, str):
+            add_string(k, STR, value)
+        elif isinstance(value, bool):
+            tags[k] = BOOL
+            ints[k] = int(value)
+        elif isinstance(value, int):
+            if INT64_MIN <= value <= INT64_MAX:
+                tags[k] = INT
+                ints[k] = value
+            else:
+                add_string(k, BIGINT, str(value))
+        elif isinstance(value, float):
+            tags[k] = FLOAT
+            floats[k] = value
+        elif isinstance(value, datetime.datetime):
+            tags[k] = DATETIME
+            ints[k] = (value.replace(tzinfo=None) - EPOCH) // MICROSECOND
+        elif isinstance(value, datetime.date):
+            tags[k] = DATE
+            ints[k] = (value - EPOCH_DATE).days
+        elif isinstance(value, datetime.time):
+            tags[k] = TIME
+            ints[k] = ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+        elif isinstance(value, datetime.timedelta):
+            tags[k] = TIMEDELTA
+            ints[k] = value // MICROSECOND
+        else:
+            add_string(k, STR, str(value))
+    return bytes(tags), bytes(data), bytes(heap)
+
+
+def decode_column(buffer, tags_offset, data_offset, heap_offset, count, start, stop) -> list:
+    tags = buffer[tags_offset + start:tags_offset + stop]
+    data = memoryview(buffer)[data_offset:data_offset + 8 * count]
+    ints = data.cast('q')
+    floats = data.cast('d')
+
+    if not any(tags):
+        ints.release()
+        floats.release()
+        data.release()
+        return [None] * (stop - start)
+
+    values = []
+    append = values.append
+    for k, tag in enumerate(tags, start):
+        if tag == NONE:
+            append(None)
+        elif tag == STR:
+            slot = ints[k]
+            offset = heap_offset + (slot >> 24)
+            append(buffer[offset:offset + (slot & 0xFFFFFF)].decode('utf-8', 'surrogatepass'))
+        elif tag == INT:
+            append(ints[k])
+        elif tag == FLOAT:
+            append(floats[k])
+        elif tag == BOOL:
+            append(bool(ints[k]))
+        elif tag == DATETIME:
+            append(EPOCH + ints[k] * MICROSECOND)
+        elif tag == DATE:
+            append(EPOCH_DATE + datetime.timedelta(days=ints[k]))
+        elif tag == TIME:
+            append((EPOCH + ints[k] * MICROSECOND).time())
+        elif tag == TIMEDELTA:
+            append(ints[k] * MICROSECOND)
+        else:
+            slot = ints[k]
+            offset = heap_offset + (slot >> 24)
+            append(int(buffer[offset:offset + (slot & 0xFFFFFF)]))
+    ints.release()
+    floats.release()
+    data.release()
+    return values
+
+
+class CacheWriter:
+    def __init__(self, path, key, columns):
+        self.path = Path(path)
+        self.key = key
+        self.columns = columns
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.temp = self.path.with_name('{}.{}.{}.tmp'.format(self.path.name, os.getpid(), threading.get_ident()))
+        self.file = open(self.temp, 'wb')
+        self.file.write(MAGIC)
+        self.groups = []
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) == GROUP_ROWS:
+            self.write_group()
+
+    def write_group(self):
+        rows = self.rows
+        width = max((len(row) for row in rows), default=0)
+        columns = []
+        for col in range(width):
+            tags, data, heap = encode_column(rows, col)
+            tags_offset = self.file.tell()
+            self.file.write(tags)
+            data_offset = pad(self.file)
+            self.file.write(data)
+            heap_offset = self.file.tell()
+            self.file.write(heap)
+            pad(self.file)
+            columns.append((tags_offset, data_offset, heap_offset))
+        self.groups.append({'rows' : len(rows), 'columns' : columns})
+        self.count += len(rows)
+        self.rows = []
+
+    def close(self):
+        if self.rows:
+            self.write_group()
+        footer = json.dumps({
+            'key' : self.key,
+            'rows' : self.count,
+            'columns' : self.columns,
+            'groups' : self.groups
+            }).encode('utf-8')
+        offset = self.file.tell()
+        self.file.write(footer)
+        self.file.write(TRAILER.pack(offset, len(footer), MAGIC))
+        self.file.close()
+        try:
+            os.replace(self.temp, self.path)
+        except OSError:
+            # another process reads the old file right now, the next run will try again
+            self.temp.unlink()
+
+    def abort(self):
+        self.file.close()
+        try:
+            self.temp.unlink()
+        except OSError:
+            pass
+
+
+class CachedSource:
+    """
+    A source read from the cache file. The file is mapped only while rows are
+    iterated, like ExcelSource it keeps nothing open between calls.
+    """
+    def __init__(self, path, cache_path, footer):
+        self.path = path
+        self.cache_path = cache_path
+        self.total = footer['rows']
+        self.columns = footer['columns']
+        self.rows = self.total
+        self.groups = footer['groups']
+
+    @classmethod
+    def open(cls, path, cache_path, key):
+        try:
+            with open(cache_path, 'rb') as f:
+                f.seek(-TRAILER.size, os.SEEK_END)
+                offset, length, magic = TRAILER.unpack(f.read(TRAILER.size))
+                if magic != MAGIC:
+                    return None
+                f.seek(offset)
+                footer = json.loads(f.read(length).decode('utf-8'))
+        except (OSError, ValueError, struct.error):
+            return None
+        if footer.get('key') != key:
+            return None
+        return cls(path, cache_path, footer)
+
+    def header(self) -> list:
+        for row in self.iter_rows(min_row=1, max_row=1):
+            row = list(row)
+            if self.columns is not None and len(row) < self.columns:
+                row += [None] * (self.columns - len(row))
+            return row
+        return []
+
+    def row_count(self) -> int:
+        return max(self.total - 1, 0)
+
+    def iter_rows(self, min_row=2, max_row=None):
+        last = self.total if max_row is None else min(max_row, self.total)
+        if last < min_row:
+            return
+
+        with open(self.cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            first = 1
+            for group in self.groups:
+                count = group['rows']
+                start = max(min_row - first, 0)
+                stop = min(last - first + 1, count)
+                first += count
+                if start >= stop:
+                    if first > last:
+                        break
+                    continue
+
+                columns = [decode_column(buffer, tags_offset, data_offset, heap_offset, count, start, stop)
+                           for tags_offset, data_offset, heap_offset in group['columns']]
+                if columns:
+                    yield from zip(*columns)
+                else:
+                    yield from [()] * (stop - start)
+
+
+class CachingSource:
+    """
+    Passes another source through and writes the cache while all of its rows
+    are read for the first time, so the cache costs no extra pass over the file.
+    """
+    def __init__(self, source, cache_path, key):
+        self.source = source
+        self.path = source.path
+        self.cache_path = cache_path
+        self.key = key
+
+    @property
+    def columns(self):
+        return self.source.columns
+
+    @property
+    def rows(self):
+        return self.source.rows
+
+    def header(self) -> list:
+        return self.source.header()
+
+    def row_count(self) -> int:
+        return self.source.row_count()
+
+    def iter_rows(self, min_row=2, max_row=None):
+        if min_row > 2 or max_row is not None:
+            yield from self.source.iter_rows(min_row, max_row)
+            return
+
+        writer = CacheWriter(self.cache_path, self.key, self.columns)
+        complete = False
+        try:
+            if min_row == 2:
+                header = next(iter(self.source.iter_rows(min_row=1, max_row=1)), ())
+                writer.add(header)
+            for row in self.source.iter_rows(min_row=min_row):
+                writer.add(row)
+                yield row
+            complete = True
+        finally:
+            if complete:
+                writer.close()
+            else:
+                writer.abort()
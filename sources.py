@@ -0,0 +1,169 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+from sourcecache import CachedSource, CachingSource, cache_file, cache_key
+
+CSV_SUFFIXES = ('.csv', '.tsv', '.txt')
+DEFAULT_ENCODING = 'utf-8-sig'
+DELIMITERS = ',;\t|'
+SNIFF_SIZE = 64 * 1024
+
+
+class ExcelSource:
+    """
+    Reads the first sheet of a workbook, or the named one, in read-only mode. Nothing
+    is kept in memory between calls: every iteration streams the file again.
+    """
+    def __init__(self, path: str, sheet=''):
+        self.path = path
+        self.sheet = sheet
+        self.rows = None
+        self.columns = None
+
+        wb = self.open()
+        try:
+            ws = wb[self.sheet or wb.sheetnames[0]]
+            # the stored dimension is only an estimate, it is used for progress and header width
+            self.rows = ws.max_row
+            self.columns = ws.max_column
+        finally:
+            wb.close()
+
+    def open(self):
+        return load_workbook(self.path, read_only=True, data_only=True)
+
+    def header(self) -> list:
+        for row in self.iter_rows(min_row=1, max_row=1):
+            row = list(row)
+            if self.columns is not None and len(row) < self.columns:
+                row += [None] * (self.columns - len(row))
+            return row
+        return []
+
+    def row_count(self) -> int:
+        return max((self.rows or 1) - 1, 0)
+
+    def iter_rows(self, min_row=2, max_row=None):
+        wb = self.open()
+        try:
+            ws = wb[self.sheet or wb.sheetnames[0]]
+            # a wrong dimension in the file must not cut the data, so rows are read until the end
+            ws.reset_dimensions()
+            for row in ws.iter_rows(min_row=min_row, max_row=max_row, values_only=True):
+                yield row
+        finally:
+            wb.close()
+
+
+class CsvSource:
+    """
+    Streams a delimited text file, the same way ExcelSource streams a workbook. Values
+    stay strings, an empty delimiter is guessed: tab for .tsv, otherwise from the first lines.
+    """
+    def __init__(self, path: str, encoding=DEFAULT_ENCODING, delimiter=''):
+        self.path = path
+        self.encoding = encoding or DEFAULT_ENCODING
+        self.delimiter = delimiter or self.guess_delimiter()
+        self.rows = self.count_lines()
+        self.columns = None
+        self.columns = len(self.header())
+
+    def guess_delimiter(self) -> str:
+        if Path(self.path).suffix.lower() == '.tsv':
+            return '\t'
+        # the header line decides: the candidate found there most often
+        with open(self.path, encoding=self.encoding, newline='') as f:
+            line = f.readline(SNIFF_SIZE)
+        counts = [(line.count(delimiter), -i, delimiter) for i, delimiter in enumerate(DELIMITERS)]
+        count, _, delimiter = max(counts)
+        return delimiter if count > 0 else ','
+
+    def count_lines(self) -> int:
+        # quoted values with line breaks make this an estimate, like the dimension of a workbook
+        count = 0
+        last = b'\n'
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                count += block.count(b'\n')
+                last = block[-1:]
+        return count + (last != b'\n')
+
+    def header(self) -> list:
+        for row in self.iter_rows(min_row=1, max_row=1):
+            row = list(row)
+            if self.columns is not None and len(row) < self.columns:
+                row += [None] * (self.columns - len(row))
+            return row
+        return []
+
+    def row_count(self) -> int:
+        return max((self.rows or 1) - 1, 0)
+
+    def iter_rows(self, min_row=2, max_row=None):
+        with open(self.path, encoding=self.encoding, newline='') as f:
+            for number, row in enumerate(csv.reader(f, delimiter=self.delimiter), 1):
+                if max_row is not None and number > max_row:
+                    break
+                if number >= min_row:
+                    yield tuple(row)
+
+
+class RowsSource:
+    """
+    All rows of another source, read once and kept in memory, so several
+    projects over the same file do not parse it again.
+    """
+    def __init__(self, source):
+        self.path = source.path
+        self.columns = source.columns
+        self.rows = list(source.iter_rows(min_row=1))
+
+    def header(self) -> list:
+        if not self.rows:
+            return []
+        row = list(self.rows[0])
+        if self.columns is not None and len(row) < self.columns:
+            row += [None] * (self.columns - len(row))
+        return row
+
+    def row_count(self) -> int:
+        return max(len(self.rows) - 1, 0)
+
+    def iter_rows(self, min_row=2, max_row=None):
+        return iter(self.rows[min_row - 1:max_row])
+
+
+def is_csv_file(path: str) -> bool:
+    return str(path).lower().endswith(CSV_SUFFIXES)
+
+
+def open_source(path: str, encoding='', delimiter='', cache_dir=None, sheet=''):
+    # with cache_dir an unchanged file is read from the cache, otherwise the cache is written on the first full pass
+    options = (encoding, delimiter) if is_csv_file(path) else ((sheet,) if sheet else ())
+    if cache_dir is not None:
+        key = cache_key(path, options)
+        cached = CachedSource.open(path, cache_file(cache_dir, path, options), key)
+        if cached is not None:
+            return cached
+
+    source = CsvSource(path, encoding, delimiter) if is_csv_file(path) else ExcelSource(path, sheet)
+    if cache_dir is not None:
+        source = CachingSource(source, cache_file(cache_dir, path, options), key)
+    return source
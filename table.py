@@ -77,8 +77,12 @@ class Ui_MainWindow(object):
         self.progress_bar.setTextVisible(False)
         self.progress_bar.setObjectName("progress_bar")
         self.button_start = QtWidgets.QPushButton(self.centralwidget)
-        self.button_start.setGeometry(QtCore.QRect(30, 600, 741, 31))
+        self.button_start.setGeometry(QtCore.QRect(30, 600, 601, 31))
         self.button_start.setObjectName("button_start")
+        self.button_cancel = QtWidgets.QPushButton(self.centralwidget)
+        self.button_cancel.setEnabled(False)
+        self.button_cancel.setGeometry(QtCore.QRect(640, 600, 131, 31))
+        self.button_cancel.setObjectName("button_cancel")
         self.line_edit_added = QtWidgets.QLineEdit(self.centralwidget)
         self.line_edit_added.setGeometry(QtCore.QRect(240, 150, 341, 31))
         self.line_edit_added.setObjectName("line_edit_added")
@@ -168,6 +172,7 @@ class Ui_MainWindow(object):
         self.label_pattern.setText(_translate("MainWindow", "Шаблон:"))
         self.button_select_pattern.setText(_translate("MainWindow", "Выбрать файл"))
         self.button_start.setText(_translate("MainWindow", "Начать создавать файлы"))
+        self.button_cancel.setText(_translate("MainWindow", "Отмена"))
         self.label_2.setText(_translate("MainWindow", "Добавить текст к имени файла:"))
         self.label_3.setText(_translate("MainWindow", "Добавить порядковый номер к концу файла"))
         self.label_4.setText(_translate("MainWindow", "Использовать столбец как новые имена:"))
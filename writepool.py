@@ -0,0 +1,266 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import time
+import shutil
+from pathlib import Path
+from collections import deque
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+from concurrent.futures import Future, ThreadPoolExecutor
+
+WRITE_THREADS = 4
+MAX_PENDING_FILES = 64
+MAX_PENDING_BYTES = 256 * 2**20
+
+
+def detach(path):
+    # a hard link shares its bytes with other files, writing into it would change them too
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def write_file(path, fallback, data):
+    start = time.perf_counter()
+    try:
+        detach(path)
+        with open(path, 'wb') as f:
+            f.write(data)
+        fell_back = False
+    except OSError:
+        # a name the file system does not accept
+        detach(fallback)
+        with open(fallback, 'wb') as f:
+            f.write(data)
+        fell_back = True
+    return fell_back, time.perf_counter() - start
+
+
+def replace_with(source, path, copy):
+    if not copy:
+        temp = path + '.link'
+        try:
+            os.link(source, temp)
+            os.replace(temp, path)
+            return
+        except OSError:
+            # no hard links on this file system, or between these folders
+            if os.path.lexists(temp):
+                os.unlink(temp)
+    if os.path.exists(path) and os.path.samefile(source, path):
+        return
+    detach(path)
+    shutil.copyfile(source, path)
+
+
+def link_file(path, fallback, sources, copy=False):
+    """
+    Makes path a hard link to (or a copy of) a file already written, sources are
+    the path and the fallback of that file.
+    """
+    start = time.perf_counter()
+    source = sources[0] if os.path.isfile(sources[0]) else sources[1]
+    try:
+        replace_with(source, path, copy)
+        fell_back = False
+    except OSError:
+        replace_with(source, fallback, copy)
+        fell_back = True
+    return fell_back, time.perf_counter() - start
+
+
+class WriterPool:
+    """
+    Writes ready file contents on background threads while the caller prepares the next ones.
+    When too many files or bytes are waiting, submit() blocks until the oldest file is written.
+    Results come back in submission order as (tag, fell_back, write seconds, wait seconds).
+    """
+    def __init__(self, threads=WRITE_THREADS, max_files=MAX_PENDING_FILES, max_bytes=MAX_PENDING_BYTES, write=write_file):
+        self.write = write
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='writer') if threads > 0 else None
+        self.max_files = max(max_files, 1)
+        self.max_bytes = max_bytes
+        self.queue = deque()
+        self.paths = {}
+        self.pending_bytes = 0
+
+    def submit(self, path, fallback, data, tag) -> list:
+        return self.enqueue(self.write, (path, fallback, data), path, len(data), tag)
+
+    def link(self, path, fallback, sources, tag, copy=False) -> list:
+        # the file linked to has to be on disk first
+        return self.enqueue(link_file, (path, fallback, sources, copy), path, 0, tag, sources[:1])
+
+    def enqueue(self, function, args, path, size, tag, after=()) -> list:
+        done = []
+        start = time.perf_counter()
+        # the same path is written again only after the earlier file is on disk, so the last row wins
+        for other in (path,) + tuple(after):
+            previous = self.paths.get(other)
+            while previous is not None and self.paths.get(other) is previous:
+                done.append(self.pop())
+        while self.queue and (len(self.queue) >= self.max_files or self.pending_bytes + size > self.max_bytes):
+            done.append(self.pop())
+        waited = time.perf_counter() - start
+
+        if self.executor is None:
+            future = Future()
+            future.set_result(function(*args))
+        else:
+            future = self.executor.submit(function, *args)
+        self.queue.append((future, tag, path, size, waited))
+        self.paths[path] = future
+        self.pending_bytes += size
+        return done + self.ready()
+
+    def skip(self, tag) -> list:
+        # rows without a file keep their place in the order of results
+        self.queue.append((None, tag, None, 0, 0.0))
+        return self.ready()
+
+    def pop(self):
+        future, tag, path, size, waited = self.queue.popleft()
+        if future is None:
+            return tag, False, 0.0, waited
+        self.pending_bytes -= size
+        if self.paths.get(path) is future:
+            del self.paths[path]
+        fell_back, seconds = future.result()
+        return tag, fell_back, seconds, waited
+
+    def ready(self) -> list:
+        done = []
+        while self.queue and (self.queue[0][0] is None or self.queue[0][0].done()):
+            done.append(self.pop())
+        return done
+
+    def flush(self) -> list:
+        done = []
+        while self.queue:
+            done.append(self.pop())
+        return done
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+
+class HandOver:
+    """
+    Used instead of WriterPool in worker processes when the files go into an archive:
+    the files are kept and sent back to the main process, which writes the archive.
+    """
+    def __init__(self):
+        self.items = []
+
+    def submit(self, path, fallback, data, tag) -> list:
+        self.items.append((path, fallback, data, tag))
+        return []
+
+    def skip(self, tag) -> list:
+        raise ValueError('an archive is always written in full')
+
+    def flush(self) -> list:
+        return []
+
+    def take(self) -> list:
+        items = self.items
+        self.items = []
+        return items
+
+    def close(self):
+        self.items = []
+
+
+def archive_volume(path, number) -> Path:
+    path = Path(path)
+    return path.with_name('{}.{:03d}{}'.format(path.stem, number, path.suffix))
+
+
+class ZipArchive:
+    """
+    Writes files into a zip archive instead of a folder, names inside are relative to root.
+    With max_files or max_bytes the archive is split into volumes name.001.zip, name.002.zip...
+    Workbooks are zip files already, so they are stored without compressing them again.
+    """
+    def __init__(self, path, root, date_time, max_files=0, max_bytes=0):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.date_time = date_time
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.split = max_files > 0 or max_bytes > 0
+        self.names = set()
+        self.volumes = []
+        self.zip = None
+        self.files = 0
+        self.bytes = 0
+
+    def arcname(self, path) -> str:
+        return Path(path).relative_to(self.root).as_posix()
+
+    def next_volume(self):
+        if self.zip is not None:
+            self.zip.close()
+        path = archive_volume(self.path, len(self.volumes) + 1) if self.split else self.path
+        temp = path.with_name(path.name + '.tmp')
+        self.volumes.append((temp, path))
+        self.zip = ZipFile(temp, 'w', ZIP_STORED)
+        self.files = 0
+        self.bytes = 0
+
+    def write(self, path, fallback, data):
+        start = time.perf_counter()
+        name = self.arcname(path)
+        # an archive can not replace a file, a repeated name is stored like a name the file system rejects
+        fell_back = name in self.names
+        if fell_back:
+            name = self.arcname(fallback)
+        if (self.zip is None or self.max_files and self.files >= self.max_files
+                or self.max_bytes and self.files and self.bytes + len(data) > self.max_bytes):
+            self.next_volume()
+        self.zip.writestr(ZipInfo(name, self.date_time), data)
+        self.names.add(name)
+        self.files += 1
+        self.bytes += len(data)
+        return fell_back, time.perf_counter() - start
+
+    def close(self):
+        if self.zip is None:
+            self.next_volume()
+        self.zip.close()
+        for temp, path in self.volumes:
+            os.replace(temp, path)
+        # volumes of an earlier and longer run
+        if self.split:
+            number = len(self.volumes) + 1
+            while archive_volume(self.path, number).is_file():
+                archive_volume(self.path, number).unlink()
+                number += 1
+
+    def abort(self):
+        if self.zip is not None:
+            self.zip.close()
+        for temp, path in self.volumes:
+            try:
+                temp.unlink()
+            except OSError:
+                pass
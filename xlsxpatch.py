@@ -0,0 +1,231 @@
+# This file is part of ExDivider.
+#
+# ExDivider is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License,
+# or (at your option) any later version.
+#
+# ExDivider is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar. If not, see <https://www.gnu.org/licenses/>.
+
+# Writes .xlsx files by patching a template that was serialized once by openpyxl.
+# Parts without mapped cells are kept as ready deflate blobs. Sheets with mapped
+# cells are cut around those cells; the pieces in between are deflated once with
+# a full flush, so per file only the new cell xml has to be compressed.
+
+import re
+import zlib
+import struct
+from io import BytesIO
+from zipfile import ZipFile
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE, ERROR_CODES
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+from openpyxl.utils.exceptions import IllegalCharacterError
+
+COMPRESS_LEVEL = 6
+MAX_STRING_LENGTH = 32767
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+
+
+def deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def deflate_piece(data: bytes) -> bytes:
+    # a full flush ends on a byte boundary without a final block, so pieces can be concatenated
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+FINAL_BLOCK = deflate(b'')
+
+
+def dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def cell_xml(coordinate: str, style, value) -> bytes:
+    attrs = '<c r="' + coordinate + '"'
+    if style is not None:
+        attrs += ' s="' + style + '"'
+
+    if value is None:
+        return (attrs + ' t="n" />').encode('utf-8')
+    if isinstance(value, bool):
+        return (attrs + ' t="b"><v>' + str(int(value)) + '</v></c>').encode('utf-8')
+    if isinstance(value, (int, float)):
+        return (attrs + ' t="n"><v>' + repr(value) + '</v></c>').encode('utf-8')
+
+    # the same rules openpyxl applies when a string is assigned to a cell
+    value = str(value)[:MAX_STRING_LENGTH]
+    if ILLEGAL_CHARACTERS_RE.search(value):
+        raise IllegalCharacterError
+    if len(value) > 1 and value.startswith('='):
+        return (attrs + '><f>' + escape(value[1:]) + '</f><v /></c>').encode('utf-8')
+    if value in ERROR_CODES:
+        return (attrs + ' t="e"><v>' + escape(value) + '</v></c>').encode('utf-8')
+    if value == '':
+        return (attrs + ' t="inlineStr" />').encode('utf-8')
+
+    stripped = value.strip()
+    space = ' xml:space="preserve"' if stripped and stripped != value else ''
+    return (attrs + ' t="inlineStr"><is><t' + space + '>' + escape(value) + '</t></is></c>').encode('utf-8')
+
+
+def insert_cell(data: bytes, coordinate: str) -> bytes:
+    """
+    openpyxl does not write blank cells without a style, so an empty <c> is put
+    in its place: in its <row> in the order of columns, or in a new <row>.
+    """
+    letters, row = coordinate_from_string(coordinate)
+    column = column_index_from_string(letters)
+    cell = b'<c r="' + coordinate.encode('ascii') + b'" />'
+
+    match = re.search(rb'<row r="' + str(row).encode('ascii') + rb'"(?=[ />])[^>]*?(/?)>', data)
+    if match is not None:
+        if match.group(1):
+            return data[:match.start(1)] + b'>' + cell + b'</row>' + data[match.end():]
+        end = data.index(b'</row>', match.end())
+        pos = end
+        for other in re.finditer(rb'<c r="([A-Z]+)\d+"', data[match.end():end]):
+            if column_index_from_string(other.group(1).decode('ascii')) > column:
+                pos = match.end() + other.start()
+                break
+        return data[:pos] + cell + data[pos:]
+
+    row_xml = b'<row r="' + str(row).encode('ascii') + b'">' + cell + b'</row>'
+    empty = re.search(rb'<sheetData\s*/>', data)
+    if empty is not None:
+        return data[:empty.start()] + b'<sheetData>' + row_xml + b'</sheetData>' + data[empty.end():]
+    start = data.index(b'<sheetData>')
+    end = data.index(b'</sheetData>', start)
+    pos = end
+    for other in re.finditer(rb'<row r="(\d+)"', data[start:end]):
+        if int(other.group(1)) > row:
+            pos = start + other.start()
+            break
+    return data[:pos] + row_xml + data[pos:]
+
+
+class StaticPart:
+    def __init__(self, name, data):
+        self.name = name
+        self.crc = zlib.crc32(data)
+        self.size = len(data)
+        self.blob = deflate(data)
+
+    def render(self, values):
+        return self.crc, self.size, self.blob
+
+
+def cell_pattern(coordinate: str):
+    return re.compile(rb'<c r="' + coordinate.encode('ascii') + rb'"(?=[ />])[^>]*?(?:/>|>.*?</c>)', re.S)
+
+
+class PatchedPart:
+    def __init__(self, name, data, slots):
+        self.name = name
+        self.raw = []
+        self.pieces = []
+        self.slots = []
+
+        for slot, coordinate in slots:
+            if cell_pattern(coordinate).search(data) is None:
+                data = insert_cell(data, coordinate)
+
+        found = []
+        for slot, coordinate in slots:
+            match = cell_pattern(coordinate).search(data)
+            if match is None:
+                raise ValueError('cell ' + coordinate + ' is missing in ' + name)
+            found.append((match.start(), match.end(), slot, coordinate))
+        found.sort()
+
+        pos = 0
+        for start, end, slot, coordinate in found:
+            self.add_piece(data[pos:start])
+            fragment = data[start:end]
+            style = re.match(rb'<c[^>]*? s="(\d+)"', fragment)
+            self.slots.append((len(self.raw), slot, coordinate, style.group(1).decode('ascii') if style else None,
+                               fragment, deflate_piece(fragment)))
+            self.add_piece(b'')
+            pos = end
+        self.add_piece(data[pos:])
+
+    def add_piece(self, data):
+        self.raw.append(data)
+        self.pieces.append(deflate_piece(data) if data else b'')
+
+    def render(self, values):
+        raw = list(self.raw)
+        pieces = list(self.pieces)
+        for index, slot, coordinate, style, fragment, blob in self.slots:
+            value = values[slot]
+            if value is None:
+                raw[index], pieces[index] = fragment, blob
+            else:
+                xml = cell_xml(coordinate, style, value)
+                raw[index], pieces[index] = xml, deflate_piece(xml)
+
+        crc = 0
+        size = 0
+        for data in raw:
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+        pieces.append(FINAL_BLOCK)
+        return crc, size, b''.join(pieces)
+
+
+class PatchTemplate:
+    """
+    slots are (part name, coordinate) pairs; render() takes one value per slot,
+    where None keeps the cell exactly as it is in the template
+    """
+    def __init__(self, data: bytes, slots, date_time):
+        self.time, self.date = dos_date_time(date_time)
+
+        by_part = {}
+        for slot, (part, coordinate) in enumerate(slots):
+            by_part.setdefault(part, []).append((slot, coordinate))
+
+        self.parts = []
+        with ZipFile(BytesIO(data)) as archive:
+            for name in archive.namelist():
+                if name in by_part:
+                    self.parts.append(PatchedPart(name, archive.read(name), by_part.pop(name)))
+                else:
+                    self.parts.append(StaticPart(name, archive.read(name)))
+        if by_part:
+            raise ValueError('parts are missing in the template: ' + ', '.join(by_part))
+
+    def render(self, values) -> bytes:
+        out = BytesIO()
+        central = []
+        for part in self.parts:
+            crc, size, blob = part.render(values)
+            name = part.name.encode('utf-8')
+            offset = out.tell()
+            out.write(LOCAL_HEADER.pack(0x04034b50, 20, 0, 8, self.time, self.date,
+                                        crc, len(blob), size, len(name), 0))
+            out.write(name)
+            out.write(blob)
+            central.append(CENTRAL_HEADER.pack(0x02014b50, 20, 20, 0, 8, self.time, self.date,
+                                               crc, len(blob), size, len(name), 0, 0, 0, 0, 0o600 << 16, offset) + name)
+
+        start = out.tell()
+        for record in central:
+            out.write(record)
+        out.write(END_RECORD.pack(0x06054b50, 0, 0, len(central), len(central), out.tell() - start, start, 0))
+        return out.getvalue()